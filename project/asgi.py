@@ -0,0 +1,19 @@
+"""
+ASGI config for project project.
+
+It exposes the ASGI callable as a module-level variable named ``application``.
+Votes are handled by an async handler, other requests are served by the WSGI application.
+"""
+
+import os
+
+from asgiref.wsgi import WsgiToAsgi
+from django.core.wsgi import get_wsgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'project.settings')
+
+django_application = get_wsgi_application()
+
+from .voting.asgi import VotingASGIApplication  # noqa: E402 (apps must be loaded first)
+
+application = VotingASGIApplication(WsgiToAsgi(django_application))
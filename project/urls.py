@@ -18,13 +18,15 @@ from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import path, re_path
 
-from .voting.views import VotingsView, VotingDetailsView, SendVoteView
+from .voting.views import VotingsView, VotingDetailsView, SendVoteView, SendBallotView, rate_limit_metrics
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     re_path(r'^votings/(?P<status>active|finished|all|)/?$', VotingsView.as_view()),
     re_path(r'^votings/(?P<voting_id>\d+)/$', VotingDetailsView.as_view(), name='voting_detail'),
-    re_path(r'^votings/vote/(?P<voting_id>\d+)/(?P<candidate_id>\d+)$', SendVoteView.as_view(), name='send_vote')
+    re_path(r'^votings/vote/(?P<voting_id>\d+)/(?P<candidate_id>\d+)$', SendVoteView.as_view(), name='send_vote'),
+    re_path(r'^votings/ballot/(?P<voting_id>\d+)$', SendBallotView.as_view(), name='send_ballot'),
+    path('votings/ratelimit/metrics', rate_limit_metrics, name='rate_limit_metrics')
 ]
 
 urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
@@ -1,11 +1,23 @@
+import io
+
 from django import forms
 from django.apps import apps
-from django.contrib import admin
-from django.db.models.signals import post_save
+from django.contrib import admin, messages
+from django.contrib.admin import helpers
+from django.db.models import Case, F, IntegerField, Q, Value, When
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
+from django.http import StreamingHttpResponse, HttpResponseRedirect
+from django.template.response import TemplateResponse
+from django.urls import path
 from django.utils import timezone
 
 import project.voting.models as models
+from . import bulk, clock
+from .archive import archive_finished_votings, archive_voting_votes, purge_archived_votes, save_voting_result, \
+    votes_retention
+from .caching import invalidate_votings_listing
+from .partitions import ensure_votes_partition
 from .report import crete_voting_report
 from .scheduler import Scheduler
 
@@ -18,7 +30,7 @@ class MembershipInline(admin.TabularInline):
 class VotingForm(forms.ModelForm):
     class Meta:
         model = models.Voting
-        fields = ['title', 'description', 'start_date', 'end_date', 'max_votes']
+        fields = ['title', 'description', 'start_date', 'end_date', 'max_votes', 'ballot_type', 'max_choices']
 
     def __init__(self, *args, **kwargs):
         super(VotingForm, self).__init__(*args, **kwargs)
@@ -35,6 +47,11 @@ class VotingForm(forms.ModelForm):
                 for field in self.fields:
                     self.fields[field].widget.attrs['readonly'] = True
 
+            # cast ballots are packed for current ballot settings, server side enforced
+            if instance.status > models.VotingStatus.WAITING_BEGINNING:
+                self.fields['ballot_type'].disabled = True
+                self.fields['max_choices'].disabled = True
+
     draft = forms.BooleanField(help_text='Save voting as draft', initial=False, required=False)
 
     def clean_title(self):
@@ -42,6 +59,16 @@ class VotingForm(forms.ModelForm):
             raise forms.ValidationError('Title length must be greater or equal 5')
         return self.cleaned_data['title']
 
+    def clean_ballot_type(self):
+        # import files of previous versions have no ballot_type column
+        return self.cleaned_data['ballot_type'] or models.BallotType.PLURALITY
+
+    def clean_max_choices(self):
+        max_choices = self.cleaned_data['max_choices'] or 1
+        if self.cleaned_data.get('ballot_type') == models.BallotType.PLURALITY and max_choices != 1:
+            raise forms.ValidationError('Plurality ballot allows exactly one choice')
+        return max_choices
+
     def clean(self):
         # form with draft flag
         if self['draft'].value():
@@ -57,13 +84,17 @@ class VotingForm(forms.ModelForm):
         # skip start_date & end_date fields verification for draft voting
         if not self['draft'].value():
             skip_start_date_checking = False
-            start_date = self.cleaned_data["start_date"]
-            end_date = self.cleaned_data['end_date']
+            start_date = self.cleaned_data.get('start_date')
+            end_date = self.cleaned_data.get('end_date')
+            # missing or invalid dates are already reported by field validation
+            if start_date is None or end_date is None:
+                return self.cleaned_data
 
             if self.instance.pk is not None:
                 if self.instance.status == models.VotingStatus.DRAFT:
                     self.instance.status = models.VotingStatus.WAITING_BEGINNING
-                elif start_date == models.Voting.objects.get(pk=self.instance.pk).start_date:
+                # initial holds values loaded with the instance, no need to fetch it again
+                elif start_date == self.initial.get('start_date'):
                     skip_start_date_checking = True
                 elif self.instance.status in [models.VotingStatus.ACTIVE, models.VotingStatus.FINISHED]:
                     raise forms.ValidationError(
@@ -95,10 +126,13 @@ def activate_voting(voting):
     job_task, run_date = close_voting, voting.end_date
     job_name = "CLOSE '{}' voting[{}]".format(voting.title, voting.id)
 
+    # votes storage must be ready before voting accepts the first vote
+    ensure_votes_partition(voting.id)
+
     if not models.try_update_voting_status(voting, models.VotingStatus.ACTIVE):
-        if voting.end_date < timezone.now() + timezone.timedelta(minutes=5):
+        if voting.end_date < clock.now() + timezone.timedelta(minutes=5):
             return
-        job_task, run_date = activate_voting, timezone.now() + timezone.timedelta(minutes=1)
+        job_task, run_date = activate_voting, clock.now() + timezone.timedelta(minutes=1)
         job_name = "RETRY ACTIVATE '{}' voting[{}]".format(voting.title, voting.id)
 
     # todo change to logging
@@ -107,60 +141,356 @@ def activate_voting(voting):
 
 
 def close_voting(voting):
+    # web workers (premature completion by max_votes) only change status,
+    # run_scheduler process picks the change up and finalizes voting
+    if not Scheduler.is_running():
+        models.try_update_voting_status(voting, models.VotingStatus.FINISHED)
+        return
+
     scheduler = Scheduler()
     scheduler.remove_job(voting.id)
-    run_date = timezone.now() + timezone.timedelta(minutes=1)
 
     if not models.try_update_voting_status(voting, models.VotingStatus.FINISHED):
+        run_date = clock.now() + timezone.timedelta(minutes=1)
         job_name = "RETRY CLOSE '{}' voting[{}]".format(voting.title, voting.id)
         scheduler.aps.add_job(close_voting, 'date', id=str(voting.id), name=job_name, run_date=run_date, args=[voting])
         return
 
-    if getattr(apps.get_app_config('voting'), 'generate_report_on_close', False):
-        job_name = "CREATE REPORT for '{}' voting[{}]".format(voting.title, voting.id)
+    _schedule_finalization(scheduler, voting)
+
+
+def _schedule_finalization(scheduler, voting):
+    config = apps.get_app_config('voting')
+    # approval and ranked results are tallied only by finalization
+    if getattr(config, 'generate_report_on_close', False) or getattr(config, 'archive_votes_on_close', False) or \
+            voting.ballot_type != models.BallotType.PLURALITY:
+        run_date = clock.now() + timezone.timedelta(minutes=1)
+        job_name = "FINALIZE '{}' voting[{}]".format(voting.title, voting.id)
         # todo change to logging
         print("Add job: {}".format(job_name))
-        scheduler.aps.add_job(crete_voting_report, 'date', id=str(voting.id), name=job_name, run_date=run_date,
-                              args=[voting])
+        scheduler.aps.add_job(finalize_voting, 'date', id=str(voting.id), name=job_name, run_date=run_date,
+                              args=[voting], replace_existing=True)
+    else:
+        models.Voting.objects.filter(pk=voting.id).update(finalization_pending=False)
 
 
-@receiver(post_save, sender=models.Voting)
-def _register_voting_activation(sender, **kwargs):
-    scheduler = Scheduler()
-    voting = kwargs['instance']
+def finalize_voting(voting):
+    config = apps.get_app_config('voting')
+    generate_report = getattr(config, 'generate_report_on_close', False)
+    archive_votes = getattr(config, 'archive_votes_on_close', False)
 
-    if voting.status == models.VotingStatus.DRAFT:
-        scheduler.remove_job(voting.id)
-        return
+    # ballots are tallied once for report, archive and voting page
+    result = None
+    if generate_report or voting.ballot_type != models.BallotType.PLURALITY:
+        from .tally import tally_voting
+        result = tally_voting(voting)
+    if voting.ballot_type != models.BallotType.PLURALITY:
+        save_voting_result(voting, result)
+
+    if generate_report:
+        crete_voting_report(voting, result)
+
+    # raw votes are archived only after report is generated
+    if archive_votes:
+        archive_voting_votes(voting, result)
+
+    models.Voting.objects.filter(pk=voting.id).update(finalization_pending=False)
+
+
+def _sync_voting_job(scheduler, voting):
+    """Make scheduled job of voting match its current status and dates"""
+    job = scheduler.aps.get_job(str(voting.id))
 
     if voting.status == models.VotingStatus.WAITING_BEGINNING:
-        scheduler.remove_job(voting.id)
+        job_task, run_date = activate_voting, voting.start_date
         job_name = "ACTIVATE '{}' voting[{}]".format(voting.title, voting.id)
+    elif voting.status == models.VotingStatus.ACTIVE:
+        job_task, run_date = close_voting, voting.end_date
+        job_name = "CLOSE '{}' voting[{}]".format(voting.title, voting.id)
+    else:
+        # voting was closed or moved to draft by another process
+        if job and job.func in (activate_voting, close_voting):
+            scheduler.remove_job(voting.id)
+            if voting.status == models.VotingStatus.FINISHED:
+                _schedule_finalization(scheduler, voting)
+        return
+
+    # overdue jobs are run immediately instead of being dropped as misfired
+    run_date = max(run_date, clock.now())
+    if job and job.func is job_task and job.next_run_time == run_date:
+        return
+
+    # todo change to logging
+    print("Add job: {}".format(job_name))
+    scheduler.aps.add_job(job_task, 'date', id=str(voting.id), name=job_name, run_date=run_date, args=[voting],
+                          replace_existing=True)
+
+
+def _expire_overdue_votings():
+    now = clock.now()
+    status = models.VotingStatus
+
+    expired = models.Voting.objects.filter(status=status.WAITING_BEGINNING, end_date__lte=now)\
+        .update(status=status.EXPIRED, modified=now)
+    if expired:
         # todo change to logging
-        print("Add job: {}".format(job_name))
-        scheduler.aps.add_job(activate_voting, 'date', id=str(voting.id), name=job_name, run_date=voting.start_date,
-                              args=[voting])
+        print("Set to EXPIRED state {} votings".format(expired))
+
+    # set to FINISHED state all active votings with expired end date and have at least one vote or ballot
+    overdue = models.Voting.objects.filter(status=status.ACTIVE, end_date__lte=now)
+    with_votes = overdue.filter(Q(votingcandidate__candidatevotes__isnull=False) | Q(ballot__isnull=False))
+    finished = models.Voting.objects.filter(pk__in=with_votes.values('pk'))\
+        .update(status=status.FINISHED, modified=now, finalization_pending=True)
+    if finished:
+        # todo change to logging
+        print("Set to FINISHED state {} votings".format(finished))
+
+    without_voters = overdue.update(status=status.FINISHED_WITHOUT_VOTERS, modified=now)
+    if without_voters:
+        # todo change to logging
+        print("Set to FINISHED_WITHOUT_VOTERS state {} votings".format(without_voters))
+
+    if expired or finished or without_voters:
+        invalidate_votings_listing()
+
+
+def sync_voting_jobs(since=None):
+    """
+    Bring scheduled jobs in line with votings stored in DB. Only votings modified after `since` are synced,
+    full sync (since is None) also expires overdue votings and drops jobs of removed votings.
+    """
+    scheduler = Scheduler()
+
+    if since is not None:
+        for voting in models.Voting.objects.filter(modified__gte=since).iterator():
+            _sync_voting_job(scheduler, voting)
+        return
+
+    _expire_overdue_votings()
+
+    synced_ids = set()
+    for voting in models.Voting.objects.filter(status__in=[models.VotingStatus.WAITING_BEGINNING,
+                                                           models.VotingStatus.ACTIVE]).iterator():
+        _sync_voting_job(scheduler, voting)
+        synced_ids.add(str(voting.id))
+
+    for job in scheduler.aps.get_jobs():
+        if job.func in (activate_voting, close_voting) and job.id not in synced_ids:
+            scheduler.remove_job(job.id)
+
+    # votings closed by web workers (max_votes) or while scheduler was restarting
+    for voting in models.Voting.objects.filter(status=models.VotingStatus.FINISHED,
+                                               finalization_pending=True).iterator():
+        job = scheduler.aps.get_job(str(voting.id))
+        if not job or job.func is not finalize_voting:
+            _schedule_finalization(scheduler, voting)
+
+    config = apps.get_app_config('voting')
+    if getattr(config, 'archive_votes_on_close', False):
+        # archive votings which were closed while scheduler was down
+        scheduler.aps.add_job(archive_finished_votings, 'date', id='archive_finished_votings',
+                              name='ARCHIVE finished votings', run_date=clock.now(), replace_existing=True)
+        # purging deletes voters data for good, it runs only when retention is configured
+        if votes_retention() is None:
+            scheduler.remove_job('purge_archived_votes')
+        elif not scheduler.aps.get_job('purge_archived_votes'):
+            scheduler.aps.add_job(purge_archived_votes, 'interval', id='purge_archived_votes',
+                                  name='PURGE archived votes',
+                                  seconds=int(getattr(config, 'votes_purge_interval').total_seconds()))
+
+
+@receiver(post_save, sender=models.Voting)
+def _register_voting_activation(sender, **kwargs):
+    invalidate_votings_listing()
+    # in web workers jobs are registered by run_scheduler process on its next sync
+    if Scheduler.is_running():
+        _sync_voting_job(Scheduler(), kwargs['instance'])
+
+
+@receiver(post_delete, sender=models.Voting)
+def _unregister_voting(sender, **kwargs):
+    invalidate_votings_listing()
+    if Scheduler.is_running():
+        Scheduler().remove_job(kwargs['instance'].id)
+
+
+class BulkImportForm(forms.Form):
+    file = forms.FileField(help_text='CSV file with header row or JSONL file, one object per line')
+    format = forms.ChoiceField(choices=[('', 'detect by extension')] + [(f, f.upper()) for f in bulk.FORMATS],
+                               required=False)
+
+
+class BulkImportMixin(object):
+    """Adds CSV/JSONL import page to model admin changelist, bulk_import(rows) does the job"""
+    change_list_template = 'admin/voting/bulk_import_change_list.html'
+    bulk_import = None
+
+    def get_urls(self):
+        info = self.model._meta.app_label, self.model._meta.model_name
+        return [
+            path('import/', self.admin_site.admin_view(self.bulk_import_view), name='%s_%s_import' % info),
+        ] + super(BulkImportMixin, self).get_urls()
+
+    def bulk_imported(self, request, created):
+        return len(created) if isinstance(created, list) else created
+
+    def bulk_import_view(self, request):
+        if not self.has_add_permission(request):
+            return HttpResponseRedirect('../')
+
+        form = BulkImportForm(request.POST or None, request.FILES or None)
+        if request.method == 'POST' and form.is_valid():
+            upload = form.cleaned_data['file']
+            fmt = form.cleaned_data['format'] or bulk.detect_format(upload.name)
+            stream = io.TextIOWrapper(upload.file, encoding='utf-8', newline='')
+            created, errors = self.bulk_import(bulk.read_rows(stream, fmt))
+
+            self.message_user(request, 'Imported {} {}'.format(self.bulk_imported(request, created),
+                                                              self.model._meta.verbose_name_plural))
+            for line_num, error in errors[:20]:
+                self.message_user(request, 'line {}: {}'.format(line_num, error), messages.ERROR)
+            if len(errors) > 20:
+                self.message_user(request, '{} more rows rejected'.format(len(errors) - 20), messages.ERROR)
+            return HttpResponseRedirect('../')
+
+        context = dict(self.admin_site.each_context(request), form=form, opts=self.model._meta,
+                       title='Import {}'.format(self.model._meta.verbose_name_plural))
+        return TemplateResponse(request, 'admin/voting/bulk_import.html', context)
+
+
+def export_votes_action(fmt):
+    def export_votes(modeladmin, request, queryset):
+        voting_ids = list(queryset.values_list('id', flat=True))
+        response = StreamingHttpResponse(bulk.iter_votes_lines(fmt, voting_ids),
+                                         content_type='text/csv' if fmt == bulk.CSV_FORMAT else 'application/jsonl')
+        response['Content-Disposition'] = 'attachment; filename="votes.{}"'.format(fmt)
+        return response
+
+    export_votes.__name__ = 'export_votes_{}'.format(fmt)
+    export_votes.short_description = 'Export votes of selected votings ({})'.format(fmt.upper())
+    return export_votes
+
+
+class VotingStatusFilter(admin.SimpleListFilter):
+    title = 'status'
+    parameter_name = 'status'
+
+    def lookups(self, request, model_admin):
+        return [(status, title.title()) for status, title in sorted(models.VotingStatus.STATUS_TO_STR_DICT.items())]
+
+    def queryset(self, request, queryset):
+        # unknown values (e.g. hand edited URL) leave the changelist unfiltered
+        if self.value() in [str(status) for status in models.VotingStatus.STATUS_TO_STR_DICT]:
+            return queryset.filter(status=self.value())
+        return queryset
+
+
+class ShiftScheduleForm(forms.Form):
+    days = forms.IntegerField(initial=0)
+    hours = forms.IntegerField(initial=0)
+    minutes = forms.IntegerField(initial=0)
+
+    def clean(self):
+        cleaned_data = super(ShiftScheduleForm, self).clean()
+        if not self.errors and not self.delta():
+            raise forms.ValidationError('Shift must not be zero')
+        return cleaned_data
+
+    def delta(self):
+        return timezone.timedelta(days=self.cleaned_data['days'], hours=self.cleaned_data['hours'],
+                                  minutes=self.cleaned_data['minutes'])
+
+
+def _resync_votings(since):
+    """Single re-sync after set-based update, votings were touched by `modified` column"""
+    invalidate_votings_listing()
+    # web workers leave jobs to run_scheduler, it picks up modified votings on its next sync
+    if Scheduler.is_running():
+        sync_voting_jobs(since=since)
 
 
 @admin.register(models.Voting)
-class VotingAdmin(admin.ModelAdmin):
+class VotingAdmin(BulkImportMixin, admin.ModelAdmin):
     list_display = ('title', 'start_date', 'end_date', 'created', 'status_str', 'id')
+    list_filter = (VotingStatusFilter, 'start_date', 'end_date')
+    search_fields = ('=id', 'title')
+    date_hierarchy = 'start_date'
+    # counting all votings on every changelist page is expensive for big tables
+    show_full_result_count = False
     inlines = [MembershipInline]
     form = VotingForm
+    bulk_import = staticmethod(bulk.import_votings)
+    actions = ['shift_schedule', 'force_close', 'move_to_draft',
+               export_votes_action(bulk.CSV_FORMAT), export_votes_action(bulk.JSONL_FORMAT)]
 
     def status_str(self, obj):
         return obj.status_str()
 
+    def _report_update(self, request, queryset, updated, action):
+        skipped = queryset.count() - updated
+        self.message_user(request, '{} {} votings'.format(action, updated))
+        if skipped:
+            self.message_user(request, '{} votings skipped due to their status or dates'.format(skipped),
+                              messages.WARNING)
+
+    def shift_schedule(self, request, queryset):
+        status = models.VotingStatus
+        form = ShiftScheduleForm(request.POST if 'apply' in request.POST else None)
+
+        if form.is_valid():
+            now = timezone.now()
+            delta = form.delta()
+            minimum_start_date = now + timezone.timedelta(minutes=1)
+            # same rules as VotingForm: started votings keep their dates, non draft ones must start in future,
+            # EXPIRED votings with new dates are waiting for beginning again
+            updated = queryset.filter(status__in=[status.DRAFT, status.WAITING_BEGINNING, status.EXPIRED])\
+                .filter(Q(status=status.DRAFT) | Q(start_date__gte=minimum_start_date - delta))\
+                .update(start_date=F('start_date') + delta, end_date=F('end_date') + delta, modified=now,
+                        status=Case(When(status=status.DRAFT, then=Value(status.DRAFT)),
+                                    default=Value(status.WAITING_BEGINNING), output_field=IntegerField()))
+            _resync_votings(now)
+            self._report_update(request, queryset, updated, 'Rescheduled')
+            return None
+
+        context = dict(self.admin_site.each_context(request), form=form, opts=self.model._meta,
+                       queryset=queryset, action_checkbox_name=helpers.ACTION_CHECKBOX_NAME,
+                       select_across=request.POST.get('select_across') == '1',
+                       title='Shift schedule of selected votings')
+        return TemplateResponse(request, 'admin/voting/shift_schedule.html', context)
+
+    shift_schedule.short_description = 'Shift schedule of selected votings'
+
+    def force_close(self, request, queryset):
+        now = timezone.now()
+        updated = queryset.filter(status=models.VotingStatus.ACTIVE).update(
+            status=models.VotingStatus.FINISHED, modified=now, finalization_pending=True)
+        _resync_votings(now)
+        self._report_update(request, queryset, updated, 'Closed')
+
+    force_close.short_description = 'Close selected ACTIVE votings now'
+
+    def move_to_draft(self, request, queryset):
+        now = timezone.now()
+        # VotingForm does not allow ACTIVE and FINISHED votings to become drafts
+        updated = queryset.filter(status__in=[models.VotingStatus.UNKNOWN, models.VotingStatus.WAITING_BEGINNING,
+                                              models.VotingStatus.EXPIRED])\
+            .update(status=models.VotingStatus.DRAFT, modified=now)
+        _resync_votings(now)
+        self._report_update(request, queryset, updated, 'Moved to DRAFT')
+
+    move_to_draft.short_description = 'Move selected votings to DRAFT'
+
 
 @admin.register(models.Candidate)
-class CandidatesAdmin(admin.ModelAdmin):
+class CandidatesAdmin(BulkImportMixin, admin.ModelAdmin):
     list_display = ('full_name', 'age', 'created')
     inlines = [MembershipInline]
+    bulk_import = staticmethod(bulk.import_candidates)
 
     def full_name(self, obj):
         return obj.full_name()
 
 
 @admin.register(models.VotingCandidate)
-class VotingCandidatesAdmin(admin.ModelAdmin):
-    pass
+class VotingCandidatesAdmin(BulkImportMixin, admin.ModelAdmin):
+    bulk_import = staticmethod(bulk.import_memberships)
@@ -1,86 +1,51 @@
-import sys
-
 from django.apps import AppConfig
 from django.utils import timezone
 
-from .scheduler import Scheduler
-
 
 class VotingConfig(AppConfig):
     name = 'project.voting'
 
     # db related configs
     maximum_rows_per_request = 1000
+    bulk_batch_size = 1000
 
     # Voting configs
     check_ip_address = False
     generate_report_on_close = True
     activate_close_retry_count = 5
     min_voting_duration = timezone.timedelta(minutes=1)
-
-    # Scheduler configs (uncomment and change)
+    # size of DB thread pool used by async vote handler (project/asgi.py)
+    async_vote_worker_count = 10
+
+    # Rate limiting configs: (tokens per second, burst size) per client IP
+    vote_rate_limit = (1, 5)
+    read_rate_limit = (10, 30)
+    # cache alias (settings.CACHES) to share buckets between processes, in-memory buckets if None
+    rate_limit_cache = None
+
+    # cache alias (settings.CACHES) for rendered votings listing pages, must be shared between processes,
+    # caching is disabled for None or process local (locmem, dummy) backends
+    listing_cache = 'default'
+
+    # Votes storage configs
+    archive_votes_on_close = True
+    # raw votes (with voter addresses) of archived votings are deleted after this period,
+    # purging is disabled for None, e.g. timezone.timedelta(days=30) to enable it
+    votes_retention = None
+    votes_purge_interval = timezone.timedelta(hours=1)
+    # partitioning requires PostgreSQL 11+ and `manage.py partition_votes` to be run once
+    votes_partitioning = False
+    votes_partition_size = 1000
+    votes_partition_retention_action = 'detach'  # 'detach' or 'drop'
+
+    # Tally configs: ballots are read from DB and decoded into NumPy matrix in chunks of this size
+    tally_chunk_size = 100000
+
+    # Scheduler configs: run_scheduler re-reads votings modified in last sync interval
+    scheduler_sync_interval = timezone.timedelta(seconds=10)
+    scheduler_full_sync_interval = timezone.timedelta(minutes=10)
+    # (uncomment and change)
     # process_pool = False
     # process_worker_count = 1
     # thread_worker_count = 5
     # misfire_grace_time = 20
-
-    def ready(self):
-        if 'runserver' not in sys.argv:
-            return True
-
-        from .models import Voting, VotingStatus, get_voting_queryset
-        from .admin import activate_voting, close_voting
-
-        scheduler = Scheduler()
-        waiting_votings = get_voting_queryset(VotingStatus.WAITING_BEGINNING, sort='-end_date').all()
-
-        for index in range(len(waiting_votings)):
-            now = job_start_time = timezone.now()
-            job_name = "ACTIVATE '{}' voting".format(waiting_votings[index].title)
-
-            if waiting_votings[index].end_date <= now:
-                # change for all other votings status to EXPIRED cuz
-                # they are sorted by descending end_date column
-                ids = [voting.id for voting in waiting_votings[index:]]
-                Voting.objects.filter(pk__in=list(ids)).update(status=VotingStatus.EXPIRED)
-
-                # todo change to logging
-                print("Set to EXPIRED state {} votings".format(len(ids)))
-                break
-            elif now < waiting_votings[index].start_date:
-                job_start_time = waiting_votings[index].start_date
-
-            job_id = waiting_votings[index].id
-            # todo change to logging
-            print("Add job: {}[{}]".format(job_name, job_id))
-            scheduler.aps.add_job(activate_voting, 'date', id=str(job_id), name=job_name, run_date=job_start_time,
-                                  args=[waiting_votings[index]])
-
-        # set to FINISHED state all active votings with expired end date and have at least one vote
-        active_votings_queryset = get_voting_queryset(VotingStatus.ACTIVE, to=timezone.now())
-        active_votings = active_votings_queryset.filter(votingcandidate__candidatevotes__isnull=False)
-        ids = [voting.id for voting in active_votings]
-        Voting.objects.filter(pk__in=list(ids)).update(status=VotingStatus.FINISHED)
-
-        if len(active_votings):
-            # todo change to logging
-            print("Set to FINISHED state {} votings".format(len(active_votings)))
-
-        active_votings = get_voting_queryset(VotingStatus.ACTIVE, sort='-end_date').all()
-        for index in range(len(active_votings)):
-            now = timezone.now()
-            end_date = active_votings[index].end_date
-            if end_date <= now:
-                ids = [voting.id for voting in active_votings[index:]]
-                Voting.objects.filter(pk__in=list(ids)).update(status=VotingStatus.FINISHED_WITHOUT_VOTERS)
-
-                # todo change to logging
-                print("Set to FINISHED_WITHOUT_VOTERS state {} votings".format(len(ids)))
-                break
-
-            job_id = active_votings[index].id
-            job_name = "CLOSE '{}' voting".format(active_votings[index].title)
-            # todo change to logging
-            print("Add job: {}[{}]".format(job_name, job_id))
-            scheduler.aps.add_job(close_voting, 'date', id=str(job_id), name=job_name, run_date=end_date,
-                                  args=[active_votings[index]])
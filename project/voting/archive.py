@@ -0,0 +1,86 @@
+from django.apps import apps
+from django.db import transaction
+from django.db.models import Count
+
+from . import clock
+from .models import Ballot, BallotType, CandidateVotes, Voting, VotingCandidate, VotingResult, VotingStatus
+from .partitions import partitioning_enabled, is_partitioned, release_expired_partitions
+
+
+def votes_retention():
+    """Retention period of archived raw votes, None if purging is not enabled"""
+    return getattr(apps.get_app_config('voting'), 'votes_retention', None)
+
+
+def save_voting_result(voting, result):
+    """Store tally result as per-candidate VotingResult rows, replacing previously stored ones"""
+    with transaction.atomic():
+        VotingResult.objects.filter(voting_candidate_ids__voting_id=voting.id).delete()
+        VotingResult.objects.bulk_create(
+            [VotingResult(voting_candidate_ids_id=vc_id, votes_count=count) for vc_id, count in result.counts.items()])
+
+
+def archive_voting_votes(voting, result=None):
+    """
+    Collapse raw votes of a finished voting into per-candidate VotingResult rows.
+    Approval and ranked votings are archived from tally `result`, stored result of finalization
+    or result tallied here (in this order).
+    """
+    with transaction.atomic():
+        voting = Voting.objects.select_for_update().get(pk=voting.id)
+        if voting.votes_archived or voting.status != VotingStatus.FINISHED:
+            return False
+
+        stored_result = VotingResult.objects.filter(voting_candidate_ids__voting_id=voting.id)
+        if result is not None:
+            save_voting_result(voting, result)
+        elif voting.ballot_type == BallotType.PLURALITY:
+            votes = VotingCandidate.objects.filter(voting_id=voting.id).annotate(
+                votes_num=Count('candidatevotes'))
+            stored_result.delete()
+            VotingResult.objects.bulk_create(
+                [VotingResult(voting_candidate_ids=candidate, votes_count=candidate.votes_num)
+                 for candidate in votes])
+        elif not stored_result.exists():
+            from .tally import tally_voting
+            save_voting_result(voting, tally_voting(voting))
+        Voting.objects.filter(pk=voting.id).update(votes_archived=True)
+
+    # todo change to logging
+    print("Archived votes of voting '{}' [id:{}]".format(voting.title, voting.id))
+    return True
+
+
+def archive_finished_votings():
+    """Archive every FINISHED voting which still has only raw votes. Returns number of archived votings."""
+    archived = 0
+    for voting in Voting.objects.filter(status=VotingStatus.FINISHED, votes_archived=False).iterator():
+        if archive_voting_votes(voting):
+            archived += 1
+    return archived
+
+
+def purge_archived_votes():
+    """
+    Remove raw votes of archived votings which are older than configured retention period.
+    Partitioned storage releases whole partitions, plain storage deletes rows. Nothing is removed
+    unless VotingConfig.votes_retention is set.
+    """
+    retention = votes_retention()
+    if retention is None:
+        return 0
+
+    expired_before = clock.now() - retention
+    # approval and ranked ballots are never partitioned
+    Ballot.objects.filter(voting_id__votes_archived=True, voting_id__end_date__lte=expired_before).delete()
+
+    if partitioning_enabled() and is_partitioned():
+        return len(release_expired_partitions(expired_before))
+
+    deleted, _ = CandidateVotes.objects.filter(
+        voting_candidate_ids__voting_id__votes_archived=True,
+        voting_candidate_ids__voting_id__end_date__lte=expired_before).delete()
+    if deleted:
+        # todo change to logging
+        print('Purged {} archived votes'.format(deleted))
+    return deleted
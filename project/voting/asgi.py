@@ -0,0 +1,112 @@
+import asyncio
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+from django.apps import apps
+from django.db import close_old_connections
+from django.http import Http404
+from django.utils.html import format_html
+
+from .middleware import get_rate_limiter
+from .views import get_client_ip, send_vote
+
+_vote_path_re = re.compile(r'^/votings/vote/(?P<voting_id>\d+)/(?P<candidate_id>\d+)$')
+_default_vote_worker_count = 10
+_executor = None
+
+
+def _vote_executor():
+    global _executor
+    if _executor is None:
+        workers = getattr(apps.get_app_config('voting'), 'async_vote_worker_count', _default_vote_worker_count)
+        if not isinstance(workers, int) or workers <= 0:
+            workers = _default_vote_worker_count
+        _executor = ThreadPoolExecutor(max_workers=workers)
+    return _executor
+
+
+def _scope_meta(scope):
+    headers = dict(scope.get('headers') or [])
+    meta = {'REMOTE_ADDR': (scope.get('client') or [None])[0]}
+    x_forwarded_for = headers.get(b'x-forwarded-for')
+    if x_forwarded_for:
+        meta['HTTP_X_FORWARDED_FOR'] = x_forwarded_for.decode('latin1')
+    return meta
+
+
+def _send_vote_in_thread(voting_id, candidate_id, ip):
+    # pool threads live longer than a request, so emulate request_started / request_finished
+    close_old_connections()
+    try:
+        return 200, send_vote(voting_id, candidate_id, ip)
+    except Http404:
+        return 404, 'Not found'
+    finally:
+        close_old_connections()
+
+
+async def _send_response(send, status, body, headers=None):
+    body = body.encode('utf-8')
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', b'text/html; charset=utf-8'),
+                    (b'content-length', str(len(body)).encode('ascii'))] + (headers or []),
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def vote_handler(scope, receive, send, voting_id, candidate_id):
+    """Async counterpart of SendVoteView, DB work is offloaded to a bounded thread pool"""
+    if scope['method'] not in ('GET', 'HEAD'):
+        await _send_response(send, 405, 'Method not allowed')
+        return
+
+    meta = _scope_meta(scope)
+    retry_after = get_rate_limiter().check(scope['path'], meta)
+    if retry_after:
+        await _send_response(send, 429, 'Too many requests', [(b'retry-after', str(retry_after).encode('ascii'))])
+        return
+
+    loop = asyncio.get_event_loop()
+    status, message = await loop.run_in_executor(
+        _vote_executor(), _send_vote_in_thread, voting_id, candidate_id, get_client_ip(meta))
+
+    if status != 200:
+        await _send_response(send, status, message)
+        return
+    await _send_response(send, status, format_html('<p class="text-primary h4"><strong>{}</strong></p>', message))
+
+
+class VotingASGIApplication(object):
+    """ASGI application serving votes asynchronously, all other requests are passed to fallback application"""
+
+    def __init__(self, fallback):
+        self.fallback = fallback
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+            return
+
+        if scope['type'] == 'http':
+            match = _vote_path_re.match(scope['path'])
+            if match:
+                await vote_handler(scope, receive, send, match.group('voting_id'), match.group('candidate_id'))
+                return
+
+        await self.fallback(scope, receive, send)
+
+    @staticmethod
+    async def _lifespan(receive, send):
+        global _executor
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                if _executor is not None:
+                    _executor.shutdown(wait=True)
+                    _executor = None
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
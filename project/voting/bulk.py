@@ -0,0 +1,235 @@
+import csv
+import json
+
+from django import forms
+from django.apps import apps
+from django.db import connection, transaction
+
+from .caching import invalidate_votings_listing
+from .models import Candidate, CandidateVotes, Voting, VotingCandidate, VotingStatus
+
+CSV_FORMAT = 'csv'
+JSONL_FORMAT = 'jsonl'
+FORMATS = (CSV_FORMAT, JSONL_FORMAT)
+
+VOTES_EXPORT_FIELDS = ('id', 'voting_id', 'candidate_id', 'ip_address')
+
+_default_batch_size = 1000
+
+
+class CandidateImportForm(forms.ModelForm):
+    class Meta:
+        model = Candidate
+        fields = ['last_name', 'first_name', 'middle_name', 'age', 'biography']
+
+
+class MembershipImportForm(forms.Form):
+    voting_id = forms.IntegerField(min_value=1)
+    candidate_id = forms.IntegerField(min_value=1)
+
+
+def batch_size():
+    size = getattr(apps.get_app_config('voting'), 'bulk_batch_size', _default_batch_size)
+    return size if isinstance(size, int) and size > 0 else _default_batch_size
+
+
+def detect_format(file_name, default=CSV_FORMAT):
+    extension = str(file_name).rsplit('.', 1)[-1].lower()
+    if extension in ('jsonl', 'ndjson', 'json'):
+        return JSONL_FORMAT
+    if extension == 'csv':
+        return CSV_FORMAT
+    return default
+
+
+class RowError(object):
+    """Row which cannot be parsed, reported by importers together with validation errors"""
+
+    def __init__(self, message):
+        self.message = message
+
+
+def _parse_json_line(line):
+    try:
+        row = json.loads(line)
+    except ValueError as err:
+        return RowError('invalid JSON: {}'.format(err))
+    return row if isinstance(row, dict) else RowError('row must be JSON object')
+
+
+def _csv_rows(stream):
+    reader = csv.DictReader(stream)
+    while True:
+        try:
+            row = next(reader)
+        except StopIteration:
+            return
+        except csv.Error as err:
+            row = RowError('invalid CSV: {}'.format(err))
+        yield reader.line_num, row
+
+
+def read_rows(stream, fmt):
+    """
+    Lazily yield (line number, row dict) pairs from text stream, empty values are dropped.
+    Malformed lines are yielded as RowError.
+    """
+    if fmt == CSV_FORMAT:
+        rows = _csv_rows(stream)
+    else:
+        rows = ((line_num, _parse_json_line(line)) for line_num, line in enumerate(stream, 1) if line.strip())
+
+    for line_num, row in rows:
+        if isinstance(row, RowError):
+            yield line_num, row
+        else:
+            yield line_num, dict((str(k).strip(), v) for k, v in row.items() if k and v not in (None, ''))
+
+
+def _batches(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _form_errors(form):
+    return '; '.join('{}: {}'.format(field, ' '.join(errors)) for field, errors in form.errors.items())
+
+
+def _validated(rows, form_class, errors):
+    for line_num, row in rows:
+        if isinstance(row, RowError):
+            errors.append((line_num, row.message))
+            continue
+        form = form_class(data=row)
+        if form.is_valid():
+            yield line_num, form
+        else:
+            errors.append((line_num, _form_errors(form)))
+
+
+def import_candidates(rows):
+    """Create candidates from rows in batches, returns (created count, [(line, error), ...])"""
+    created, errors = 0, []
+    for batch in _batches(_validated(rows, CandidateImportForm, errors), batch_size()):
+        Candidate.objects.bulk_create([form.save(commit=False) for _, form in batch])
+        created += len(batch)
+    return created, errors
+
+
+def import_votings(rows):
+    """
+    Create votings from rows validated by VotingForm. Returns (created votings, [(line, error), ...]),
+    activation of WAITING votings must be scheduled by the caller as post_save is not sent.
+    """
+    from .admin import VotingForm
+
+    created, errors = [], []
+    for batch in _batches(_validated(rows, VotingForm, errors), batch_size()):
+        created.extend(Voting.objects.bulk_create([form.save(commit=False) for _, form in batch]))
+
+    if created:
+        invalidate_votings_listing()
+    return created, errors
+
+
+def import_memberships(rows):
+    """Attach candidates to votings in batches, existing memberships are skipped"""
+    created, errors = 0, []
+    locked_statuses = [VotingStatus.ACTIVE, VotingStatus.FINISHED]
+
+    for batch in _batches(_validated(rows, MembershipImportForm, errors), batch_size()):
+        pairs = [(line_num, form.cleaned_data['voting_id'], form.cleaned_data['candidate_id'])
+                 for line_num, form in batch]
+        voting_ids = set(voting_id for _, voting_id, _ in pairs)
+        candidate_ids = set(candidate_id for _, _, candidate_id in pairs)
+
+        voting_statuses = dict(Voting.objects.filter(id__in=voting_ids).values_list('id', 'status'))
+        known_candidates = set(Candidate.objects.filter(id__in=candidate_ids).values_list('id', flat=True))
+        existing = set(VotingCandidate.objects.filter(voting_id__in=voting_ids, candidate_id__in=candidate_ids)
+                       .values_list('voting_id', 'candidate_id'))
+
+        memberships = []
+        for line_num, voting_id, candidate_id in pairs:
+            if voting_id not in voting_statuses:
+                errors.append((line_num, 'voting_id: voting {} does not exist'.format(voting_id)))
+            elif candidate_id not in known_candidates:
+                errors.append((line_num, 'candidate_id: candidate {} does not exist'.format(candidate_id)))
+            elif voting_statuses[voting_id] in locked_statuses:
+                errors.append((line_num, 'voting_id: cannot change candidates of {} voting'.format(
+                    VotingStatus.STATUS_TO_STR_DICT[voting_statuses[voting_id]])))
+            elif (voting_id, candidate_id) not in existing:
+                existing.add((voting_id, candidate_id))
+                memberships.append(VotingCandidate(voting_id_id=voting_id, candidate_id_id=candidate_id))
+
+        with transaction.atomic():
+            VotingCandidate.objects.bulk_create(memberships)
+        created += len(memberships)
+
+    return created, errors
+
+
+def _votes_queryset(voting_ids=None):
+    queryset = CandidateVotes.objects.order_by('id')
+    if voting_ids:
+        queryset = queryset.filter(voting_candidate_ids__voting_id__in=voting_ids)
+    return queryset.values_list('id', 'voting_candidate_ids__voting_id', 'voting_candidate_ids__candidate_id',
+                                'ip_address')
+
+
+def iter_votes(voting_ids=None):
+    """Yield votes as dicts with VOTES_EXPORT_FIELDS keys using server side cursor"""
+    for row in _votes_queryset(voting_ids).iterator(chunk_size=batch_size()):
+        yield dict(zip(VOTES_EXPORT_FIELDS, row))
+
+
+class _Echo(object):
+    def write(self, value):
+        return value
+
+
+def iter_votes_lines(fmt, voting_ids=None):
+    """Yield serialized export lines, used by streaming HTTP responses"""
+    if fmt == CSV_FORMAT:
+        writer = csv.writer(_Echo())
+        yield writer.writerow(VOTES_EXPORT_FIELDS)
+        for vote in iter_votes(voting_ids):
+            yield writer.writerow([vote[field] for field in VOTES_EXPORT_FIELDS])
+    else:
+        for vote in iter_votes(voting_ids):
+            yield json.dumps(vote) + '\n'
+
+
+def _copy_votes_sql(cursor, voting_ids=None):
+    qn = connection.ops.quote_name
+    votes, memberships = CandidateVotes._meta, VotingCandidate._meta
+    where, params = '', []
+    if voting_ids:
+        where, params = 'WHERE vc.{} = ANY(%s)'.format(qn(memberships.get_field('voting_id').column)), \
+                        [list(voting_ids)]
+
+    sql = 'SELECT cv.id AS id, vc.{voting} AS voting_id, vc.{candidate} AS candidate_id, cv.{ip} AS ip_address ' \
+          'FROM {votes} cv JOIN {memberships} vc ON vc.id = cv.{membership} {where} ORDER BY cv.id'.format(
+            voting=qn(memberships.get_field('voting_id').column),
+            candidate=qn(memberships.get_field('candidate_id').column),
+            ip=qn(votes.get_field('ip_address').column), votes=qn(votes.db_table),
+            memberships=qn(memberships.db_table), membership=qn(votes.get_field('voting_candidate_ids').column),
+            where=where)
+    return cursor.mogrify(sql, params).decode('utf-8')
+
+
+def export_votes(stream, fmt, voting_ids=None):
+    """Write votes into text stream, CSV export is done by COPY on PostgreSQL"""
+    if fmt == CSV_FORMAT and connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.copy_expert('COPY ({}) TO STDOUT WITH CSV HEADER'.format(_copy_votes_sql(cursor, voting_ids)),
+                               stream)
+        return
+
+    for line in iter_votes_lines(fmt, voting_ids):
+        stream.write(line)
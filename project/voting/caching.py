@@ -0,0 +1,66 @@
+import time
+
+from django.apps import apps
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+
+_listing_version_key = 'votings:listing:version'
+# process local backends never see invalidations made by other processes (web workers, run_scheduler)
+_process_local_backends = (LocMemCache, DummyCache)
+
+
+def _listing_cache():
+    """Shared cache for listing pages or None if configured backend is process local"""
+    alias = getattr(apps.get_app_config('voting'), 'listing_cache', 'default')
+    if alias is None:
+        return None
+    cache = caches[alias]
+    return None if isinstance(cache, _process_local_backends) else cache
+
+
+def _listing_version(cache):
+    version = cache.get(_listing_version_key)
+    if version is None:
+        # initial version is time based so evicted counter never repeats versions of stale pages
+        cache.add(_listing_version_key, int(time.time() * 1000), None)
+        version = cache.get(_listing_version_key)
+    return version
+
+
+def _bump_listing_version():
+    cache = _listing_cache()
+    if cache is None:
+        return
+    try:
+        cache.incr(_listing_version_key)
+    except ValueError:
+        _listing_version(cache)
+
+
+def invalidate_votings_listing():
+    """
+    Invalidate every cached votings listing page, must be called after any voting change.
+    Inside transaction invalidation is postponed till commit, otherwise stale page may be cached again.
+    """
+    transaction.on_commit(_bump_listing_version)
+
+
+def listing_key(status, page, sort):
+    """
+    Cache key of listing page or None if listing caching is disabled. Key must be taken before
+    the page is rendered, so page rendered concurrently with invalidation is stored under outdated version.
+    """
+    cache = _listing_cache()
+    if cache is None:
+        return None
+    return 'votings:listing:{}:{}:{}:{}'.format(_listing_version(cache), status, page, sort)
+
+
+def get_cached_listing(key):
+    return _listing_cache().get(key)
+
+
+def set_cached_listing(key, content):
+    _listing_cache().set(key, content, None)
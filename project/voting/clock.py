@@ -0,0 +1,14 @@
+from django.utils import timezone
+
+_now = timezone.now
+
+
+def now():
+    """Current time used by voting jobs, replaceable by simulation harness"""
+    return _now()
+
+
+def install(now_func=None):
+    """Use now_func as source of current time, restores real clock when called without arguments"""
+    global _now
+    _now = now_func or timezone.now
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from ...archive import archive_finished_votings, purge_archived_votes
+
+
+class Command(BaseCommand):
+    help = 'Compact raw votes of finished votings and purge the ones older than retention period (if configured)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--no-purge', action='store_true', help='Do not purge archived raw votes')
+
+    def handle(self, *args, **options):
+        self.stdout.write('Archived {} votings'.format(archive_finished_votings()))
+        if not options['no_purge']:
+            self.stdout.write('Purged {}'.format(purge_archived_votes()))
@@ -0,0 +1,43 @@
+import timeit
+
+from django.core.management.base import BaseCommand
+from django.template.loader import render_to_string
+from django.test import RequestFactory
+
+from ...models import Voting, VotingStatus
+from ...tables import VotingCandidatesTable
+
+
+class Command(BaseCommand):
+    help = 'Benchmark rendering of voting_details.html with synthetic candidates, no DB access is required'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--candidates', type=int, default=50)
+        parser.add_argument('--iterations', type=int, default=200)
+
+    def handle(self, *args, **options):
+        request = RequestFactory().get('/votings/1/')
+        rows = [{
+            'photo': None,
+            'last_name': 'Last name {}'.format(index),
+            'first_name': 'First name',
+            'middle_name': 'Middle name',
+            'age': 40,
+            'biography': 'Biography ' * 20,
+            'votes_count': index,
+            'voting_id': 1,
+            'candidate_id': index,
+        } for index in range(options['candidates'])]
+
+        for status in (VotingStatus.ACTIVE, VotingStatus.FINISHED):
+            voting = Voting(id=1, title='Benchmark voting', description='Description', status=status)
+            exclude = ('vote',) if status == VotingStatus.FINISHED else ()
+
+            def render():
+                table = VotingCandidatesTable(rows, exclude=exclude)
+                return render_to_string('voting_details.html', {'table': table, 'voting': voting}, request)
+
+            render()  # warm up template loaders
+            elapsed = timeit.timeit(render, number=options['iterations'])
+            self.stdout.write('{} voting, {} candidates: {:.2f} ms per render'.format(
+                VotingStatus.STATUS_TO_STR_DICT[status], len(rows), elapsed * 1000 / options['iterations']))
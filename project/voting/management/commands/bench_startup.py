@@ -0,0 +1,41 @@
+import os
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# loads WSGI application and URLconf (admin autodiscovery) as a web worker does before the first request
+_worker_boot_code = """
+import os, sys, threading, time
+started = time.time()
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', {settings!r})
+from project.wsgi import application
+from django.urls import get_resolver
+get_resolver().url_patterns
+elapsed = time.time() - started
+threads = [t.name for t in threading.enumerate() if t is not threading.main_thread()]
+print(elapsed, len(threads), int('apscheduler' in sys.modules))
+"""
+
+
+class Command(BaseCommand):
+    help = 'Measure cold start time of a web worker and check that it does not start scheduler threads'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=5)
+
+    def handle(self, *args, **options):
+        code = _worker_boot_code.format(settings=os.environ.get('DJANGO_SETTINGS_MODULE', 'project.settings'))
+        timings = []
+
+        for _ in range(options['runs']):
+            output = subprocess.check_output([sys.executable, '-c', code], cwd=settings.BASE_DIR)
+            elapsed, thread_count, apscheduler_loaded = output.decode().strip().splitlines()[-1].split()
+            if int(thread_count) or int(apscheduler_loaded):
+                raise CommandError('Web worker started {} background threads (apscheduler imported: {})'.format(
+                    thread_count, bool(int(apscheduler_loaded))))
+            timings.append(float(elapsed))
+
+        self.stdout.write('Web worker cold start: min {:.1f} ms, avg {:.1f} ms over {} runs'.format(
+            min(timings) * 1000, sum(timings) * 1000 / len(timings), len(timings)))
@@ -0,0 +1,55 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from ...models import BallotType
+from ...tally import decode_ballots, tally
+
+
+class Command(BaseCommand):
+    help = 'Benchmark tally of synthetic plurality, approval and ranked ballots, no DB access is required'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ballots', type=int, default=10000000)
+        parser.add_argument('--candidates', type=int, default=10)
+        parser.add_argument('--choices', type=int, default=5, help='Candidates per approval or ranked ballot')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def _timed(self, title, func, *args):
+        started = time.perf_counter()
+        result = func(*args)
+        self.stdout.write('{}: {:.2f} s'.format(title, time.perf_counter() - started))
+        return result
+
+    def _synthetic_ballots(self, ballots, candidates, choices, seed):
+        """Ballots of VotingCandidate ids 1..candidates in random order, some of them are not fully filled"""
+        random = np.random.RandomState(seed)
+        raw = np.empty((ballots, choices), dtype='<u4')
+        chunk = 1000000
+        for start in range(0, ballots, chunk):
+            size = min(chunk, ballots - start)
+            # skewed preferences produce several instant-runoff rounds
+            weights = random.random_sample((size, candidates)) * np.linspace(1, 2, candidates)
+            raw[start:start + size] = np.argsort(weights, axis=1)[:, :choices] + 1
+            filled = random.randint(1, choices + 1, size)
+            raw[start:start + size][np.arange(choices) >= filled[:, None]] = 0
+        return raw
+
+    def handle(self, *args, **options):
+        ballots, candidates = options['ballots'], options['candidates']
+        choices = min(options['choices'], candidates)
+        voting_candidate_ids = list(range(1, candidates + 1))
+
+        raw = self._timed('Generate {} ballots'.format(ballots), self._synthetic_ballots,
+                          ballots, candidates, choices, options['seed'])
+        blob = raw.tobytes()
+        del raw
+        matrix = self._timed('Decode packed ballots', decode_ballots, [blob], voting_candidate_ids, choices)
+        del blob
+
+        for ballot_type in (BallotType.PLURALITY, BallotType.APPROVAL, BallotType.RANKED):
+            title = '{} tally'.format(BallotType.TYPE_TO_STR_DICT[ballot_type].title())
+            rounds, winner = self._timed(title, tally, ballot_type, matrix, candidates)
+            self.stdout.write('  rounds: {}, winner: voting candidate [id:{}]'.format(
+                len(rounds), voting_candidate_ids[winner] if winner is not None else None))
@@ -0,0 +1,39 @@
+import io
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ...bulk import FORMATS, detect_format, import_candidates, import_memberships, import_votings, read_rows
+
+IMPORTERS = {
+    'candidates': import_candidates,
+    'votings': import_votings,
+    'memberships': import_memberships,
+}
+
+
+class Command(BaseCommand):
+    help = 'Bulk import candidates, votings or voting-candidate memberships from CSV or JSONL file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=sorted(IMPORTERS))
+        parser.add_argument('file', help="Path to CSV/JSONL file, '-' for stdin")
+        parser.add_argument('--format', choices=FORMATS, help='File format, detected by extension by default')
+
+    def handle(self, *args, **options):
+        fmt = options['format'] or detect_format(options['file'])
+        try:
+            stream = sys.stdin if options['file'] == '-' else io.open(options['file'], encoding='utf-8', newline='')
+        except IOError as err:
+            raise CommandError(str(err))
+
+        with stream:
+            created, errors = IMPORTERS[options['kind']](read_rows(stream, fmt))
+
+        for line_num, error in errors:
+            self.stderr.write('line {}: {}'.format(line_num, error))
+        if options['kind'] == 'votings':
+            # activation jobs are registered by run_scheduler on its next sync
+            created = len(created)
+        self.stdout.write(self.style.SUCCESS('Imported {} {}, {} rows rejected'.format(
+            created, options['kind'], len(errors))))
@@ -0,0 +1,67 @@
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from ...bulk import batch_size
+from ...models import CandidateVotes
+
+
+class Command(BaseCommand):
+    help = 'Rewrite voters IP addresses of votes in normalized compact form, batch by batch. ' \
+           'On PostgreSQL run it before migrating ip_address column to inet, on other backends after migration.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None)
+        parser.add_argument('--start-id', type=int, default=0, help='Resume conversion from vote id')
+        parser.add_argument('--invalid', choices=['null', 'delete'], default='null',
+                            help='Set unparseable addresses to NULL (default) or delete such votes')
+
+    def _allow_null_addresses(self):
+        """Textual column of previous versions is NOT NULL, inet column created by migration is nullable"""
+        table = CandidateVotes._meta.db_table
+        column = CandidateVotes._meta.get_field('ip_address').column
+        with connection.cursor() as cursor:
+            description = connection.introspection.get_table_description(cursor, table)
+            if any(info.name == column and not info.null_ok for info in description):
+                qn = connection.ops.quote_name
+                cursor.execute('ALTER TABLE {} ALTER COLUMN {} DROP NOT NULL'.format(qn(table), qn(column)))
+                self.stdout.write('Column {}.{} is made nullable for invalid addresses'.format(table, column))
+
+    def handle(self, *args, **options):
+        size = options['batch_size'] or batch_size()
+        last_id, converted, invalid = options['start_id'], 0, 0
+        nullable = False
+
+        while True:
+            # values are normalized on read by InetAddressField.from_db_value, invalid ones are read as None
+            rows = list(CandidateVotes.objects.filter(id__gt=last_id, ip_address__isnull=False).order_by('id')
+                        .values_list('id', 'ip_address')[:size])
+            if not rows:
+                break
+
+            ids_by_ip = defaultdict(list)
+            for vote_id, ip in rows:
+                ids_by_ip[ip].append(vote_id)
+            invalid_ids = ids_by_ip.pop(None, [])
+
+            if invalid_ids and options['invalid'] == 'null' and not nullable:
+                self._allow_null_addresses()
+                nullable = True
+
+            with transaction.atomic():
+                for ip, ids in ids_by_ip.items():
+                    CandidateVotes.objects.filter(pk__in=ids).update(ip_address=ip)
+                if invalid_ids and options['invalid'] == 'delete':
+                    CandidateVotes.objects.filter(pk__in=invalid_ids).delete()
+                elif invalid_ids:
+                    CandidateVotes.objects.filter(pk__in=invalid_ids).update(ip_address=None)
+
+            last_id = rows[-1][0]
+            converted += len(rows)
+            invalid += len(invalid_ids)
+            self.stdout.write('Converted {} votes ({} invalid addresses), last id {}'.format(
+                converted, invalid, last_id))
+
+        self.stdout.write(self.style.SUCCESS('Done, {} votes converted, {} invalid addresses {}'.format(
+            converted, invalid, 'deleted' if options['invalid'] == 'delete' else 'set to NULL')))
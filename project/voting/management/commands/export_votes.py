@@ -0,0 +1,27 @@
+import io
+import sys
+
+from django.core.management.base import BaseCommand
+
+from ...bulk import CSV_FORMAT, FORMATS, detect_format, export_votes
+
+
+class Command(BaseCommand):
+    help = 'Export raw votes as CSV (COPY on PostgreSQL) or JSONL'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--voting', type=int, action='append', dest='voting_ids',
+                            help='Export votes of voting with supplied id only (may be repeated)')
+        parser.add_argument('--output', help='Output file, stdout by default')
+        parser.add_argument('--format', choices=FORMATS, help='Output format, detected by extension by default')
+
+    def handle(self, *args, **options):
+        output = options['output']
+        fmt = options['format'] or (detect_format(output) if output else CSV_FORMAT)
+
+        if not output:
+            export_votes(sys.stdout, fmt, options['voting_ids'])
+            return
+
+        with io.open(output, 'w', encoding='utf-8', newline='') as stream:
+            export_votes(stream, fmt, options['voting_ids'])
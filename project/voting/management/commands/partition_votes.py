@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from ...partitions import backfill_votes_voting, partition_candidate_votes
+
+
+class Command(BaseCommand):
+    help = 'Convert candidate_votes table into a table partitioned by voting id range (PostgreSQL 11+)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--backfill-only', action='store_true',
+                            help='Only fill voting reference of votes created by previous versions')
+
+    def handle(self, *args, **options):
+        if options['backfill_only']:
+            self.stdout.write('Backfilled {} votes'.format(backfill_votes_voting()))
+            return
+
+        try:
+            moved_rows = partition_candidate_votes()
+        except RuntimeError as err:
+            raise CommandError(str(err))
+        self.stdout.write(self.style.SUCCESS('candidate_votes is partitioned, {} votes moved'.format(moved_rows)))
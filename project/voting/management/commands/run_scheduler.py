@@ -0,0 +1,65 @@
+import time
+
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from ...admin import sync_voting_jobs
+from ...partitions import backfill_votes_voting
+from ...scheduler import Scheduler
+
+# pg advisory lock key which guarantees single scheduler owner per database
+_owner_lock_key = 7301022019
+
+
+class Command(BaseCommand):
+    help = 'Run voting scheduler, the only process which performs voting status transitions'
+
+    def _acquire_owner_lock(self):
+        if connection.vendor != 'postgresql':
+            self.stderr.write('Single scheduler owner is not enforced for {} database'.format(connection.vendor))
+            return
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_try_advisory_lock(%s)', [_owner_lock_key])
+            if not cursor.fetchone()[0]:
+                raise CommandError('Another run_scheduler process is already running')
+
+    def _sync(self, since=None):
+        try:
+            sync_voting_jobs(since)
+        except Exception as err:
+            # todo change to logging
+            self.stderr.write('Unable to sync voting jobs: {}'.format(err))
+            return False
+        return True
+
+    def handle(self, *args, **options):
+        config = apps.get_app_config('voting')
+        interval = getattr(config, 'scheduler_sync_interval', timezone.timedelta(seconds=10))
+        full_interval = getattr(config, 'scheduler_full_sync_interval', timezone.timedelta(minutes=10))
+
+        self._acquire_owner_lock()
+        # votes of previous versions get voting reference used by duplicate and max_votes checks
+        backfilled = backfill_votes_voting()
+        if backfilled:
+            self.stdout.write('Backfilled voting reference of {} votes'.format(backfilled))
+        scheduler = Scheduler.acquire()
+
+        last_full_sync = last_sync = timezone.now()
+        if not self._sync():
+            last_full_sync -= full_interval
+        self.stdout.write(self.style.SUCCESS('Scheduler started, {} jobs'.format(len(scheduler.aps.get_jobs()))))
+
+        try:
+            while True:
+                time.sleep(interval.total_seconds())
+                started = timezone.now()
+                if started - last_full_sync >= full_interval:
+                    if self._sync():
+                        last_full_sync = started
+                # overlap with previous sync covers transactions committed after it
+                elif self._sync(since=last_sync - interval):
+                    last_sync = started
+        except KeyboardInterrupt:
+            scheduler.shutdown()
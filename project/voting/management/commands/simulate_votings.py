@@ -0,0 +1,47 @@
+import contextlib
+import io
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from ...simulation import simulate_lifecycle
+
+
+class Command(BaseCommand):
+    help = 'Replay full lifecycle of generated votings with fake clock and in-memory scheduler in a test database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--votings', type=int, default=100000)
+        parser.add_argument('--days', type=int, default=7, help='Period over which votings start')
+        parser.add_argument('--round-minutes', type=int, default=60, help='Start dates are rounded to (bursts)')
+        parser.add_argument('--workers', type=int, default=5, help='Emulated scheduler thread pool size')
+        parser.add_argument('--misfire-grace-time', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--skip-finalize', action='store_true', help='Do not generate reports and archive votes')
+
+    def handle(self, *args, **options):
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            # jobs report progress with print, keep simulation output readable
+            with contextlib.redirect_stdout(io.StringIO()):
+                stats = simulate_lifecycle(votings=options['votings'], days=options['days'],
+                                           round_minutes=options['round_minutes'], workers=options['workers'],
+                                           misfire_grace_time=options['misfire_grace_time'], seed=options['seed'],
+                                           finalize=not options['skip_finalize'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        self.stdout.write('Simulated {votings} votings in {wall_time:.1f} s: {transitions} transitions, '
+                          '{throughput:.0f} transitions/s'.format(**stats))
+        self.stdout.write('Executed jobs: {}'.format(stats['executed']))
+        for kind, lateness in sorted(stats['lateness'].items()):
+            self.stdout.write('Lateness of {}: mean {:.3f} s, p99 {:.3f} s, max {:.3f} s'.format(
+                kind, lateness['mean'], lateness['p99'], lateness['max']))
+
+        if stats['misfired']:
+            self.stderr.write('Misfired jobs: {}'.format(stats['misfired']))
+        if stats['stale_checks'] or stats['not_finished']:
+            raise CommandError('Stale votings found: {} checkpoints with stale statuses, {} votings not FINISHED'
+                               .format(len(stats['stale_checks']), stats['not_finished']))
+        self.stdout.write(self.style.SUCCESS('No stale voting statuses'))
@@ -0,0 +1,141 @@
+import math
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from django.apps import apps
+from django.core.cache import caches
+from django.http import HttpResponse
+
+from .views import get_client_ip
+
+VOTE_ENDPOINT = 'vote'
+READ_ENDPOINT = 'read'
+
+_endpoint_patterns = (
+    (VOTE_ENDPOINT, re.compile(r'^/votings/vote/\d+/\d+$')),
+    (VOTE_ENDPOINT, re.compile(r'^/votings/ballot/\d+$')),
+    (READ_ENDPOINT, re.compile(r'^/votings/')),
+)
+_default_limits = {
+    VOTE_ENDPOINT: (1, 5),
+    READ_ENDPOINT: (10, 30),
+}
+
+
+class TokenBucket(object):
+    """Token buckets keyed by client, `rate` tokens per second are refilled up to `burst` tokens"""
+    max_buckets = 100000
+
+    def __init__(self, rate, burst, cache=None, prefix='ratelimit'):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.cache = cache
+        self.prefix = prefix
+        # LRU order: least recently used buckets are evicted first
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _refill(self, state, now):
+        if state is None:
+            return self.burst
+        tokens, timestamp = state
+        return min(self.burst, tokens + (now - timestamp) * self.rate)
+
+    def _take(self, tokens):
+        if tokens >= 1:
+            return tokens - 1, 0
+        return tokens, int(math.ceil((1 - tokens) / self.rate))
+
+    def consume(self, key):
+        """Take one token for key, returns seconds to wait before retry or 0 if request is allowed"""
+        now = time.time()
+
+        if self.cache is not None:
+            # shared buckets are approximate: concurrent requests of one client may race
+            cache_key = '{}:{}'.format(self.prefix, key)
+            tokens, retry_after = self._take(self._refill(self.cache.get(cache_key), now))
+            self.cache.set(cache_key, (tokens, now), int(math.ceil(self.burst / self.rate)) + 1)
+            return retry_after
+
+        with self._lock:
+            tokens, retry_after = self._take(self._refill(self._buckets.pop(key, None), now))
+            self._buckets[key] = (tokens, now)
+            # bounded O(1) eviction, evicted client just gets full bucket again
+            while len(self._buckets) > self.max_buckets:
+                self._buckets.popitem(last=False)
+        return retry_after
+
+
+class RateLimiter(object):
+    """Per client IP rate limiter with separate buckets for vote and read endpoints"""
+
+    def __init__(self):
+        config = apps.get_app_config('voting')
+        cache_alias = getattr(config, 'rate_limit_cache', None)
+        cache = caches[cache_alias] if cache_alias else None
+
+        self.buckets = {}
+        for endpoint, (rate, burst) in _default_limits.items():
+            rate, burst = getattr(config, '{}_rate_limit'.format(endpoint), None) or (rate, burst)
+            self.buckets[endpoint] = TokenBucket(rate, burst, cache, 'ratelimit:{}'.format(endpoint))
+
+        self._throttled = dict((endpoint, 0) for endpoint in self.buckets)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def endpoint(path):
+        for endpoint, pattern in _endpoint_patterns:
+            if pattern.match(path):
+                return endpoint
+        return None
+
+    def check(self, path, meta):
+        """Returns seconds to wait for throttled request, 0 if request is allowed"""
+        endpoint = self.endpoint(path)
+        if endpoint is None:
+            return 0
+
+        retry_after = self.buckets[endpoint].consume(get_client_ip(meta))
+        if retry_after:
+            with self._lock:
+                self._throttled[endpoint] += 1
+        return retry_after
+
+    def metrics(self):
+        with self._lock:
+            return {'throttled': dict(self._throttled)}
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter():
+    global _limiter
+    if _limiter is None:
+        with _limiter_lock:
+            if _limiter is None:
+                _limiter = RateLimiter()
+    return _limiter
+
+
+def throttled_response(retry_after):
+    response = HttpResponse('Too many requests', status=429)
+    response['Retry-After'] = str(retry_after)
+    return response
+
+
+class RateLimitMiddleware(object):
+    """Rejects excess traffic of a client before any view (and ORM query) is executed"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.limiter = get_rate_limiter()
+
+    def __call__(self, request):
+        retry_after = self.limiter.check(request.path_info, request.META)
+        if retry_after:
+            return throttled_response(retry_after)
+        return self.get_response(request)
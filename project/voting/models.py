@@ -1,15 +1,19 @@
+import ipaddress
 import operator
 import re
+import struct
 import time
 from datetime import datetime, timedelta
 from functools import reduce
 
 from django.apps import apps
 from django.db import models
-from django.db.models import Q
+from django.db.models import Lookup, Q
+from django.utils import timezone
 from imagekit.models import ImageSpecField
 from imagekit.processors import ResizeToFill
 
+from .caching import invalidate_votings_listing
 from .errors import InvalidInputException
 
 
@@ -55,6 +59,18 @@ class VotingStatus(object):
     }
 
 
+class BallotType(object):
+    PLURALITY = 1
+    APPROVAL = 2
+    RANKED = 3
+
+    TYPE_TO_STR_DICT = {
+        PLURALITY: 'PLURALITY',
+        APPROVAL: 'APPROVAL',
+        RANKED: 'RANKED CHOICE'
+    }
+
+
 def _voting_default_start_datetime():
     start_date = datetime.now()
     start_date_hour = start_date.hour + 1 if start_date.minute < 50 else start_date.hour + 2
@@ -75,6 +91,13 @@ class Voting(models.Model):
     class Meta:
         db_table = 'votings'
         ordering = ['start_date']
+        indexes = [
+            models.Index(fields=['status', 'start_date'], name='votings_status_start_idx'),
+            models.Index(fields=['status', 'end_date'], name='votings_status_end_idx'),
+            models.Index(fields=['start_date'], name='votings_start_idx'),
+            models.Index(fields=['end_date'], name='votings_end_idx'),
+            models.Index(fields=['modified'], name='votings_modified_idx'),
+        ]
 
     title = models.CharField(max_length=30)
     description = models.TextField(max_length=1024)
@@ -83,8 +106,15 @@ class Voting(models.Model):
     candidates = models.ManyToManyField(Candidate, through='VotingCandidate')
     max_votes = models.PositiveIntegerField(
         "Maximum votes number for premature completion", default=0, blank=True)
+    ballot_type = models.PositiveSmallIntegerField(
+        choices=sorted(BallotType.TYPE_TO_STR_DICT.items()), default=BallotType.PLURALITY, blank=True)
+    max_choices = models.PositiveIntegerField(
+        "Maximum candidates per approval or ranked ballot", default=1, blank=True)
 
     status = models.PositiveIntegerField(default=VotingStatus.UNKNOWN)
+    votes_archived = models.BooleanField(default=False, editable=False)
+    # set when voting becomes FINISHED, cleared by finalization (report, tally, archive) in run_scheduler
+    finalization_pending = models.BooleanField(default=False, editable=False)
     created = models.DateTimeField(auto_now=True)
     modified = models.DateTimeField(auto_now=True)
 
@@ -101,12 +131,135 @@ class VotingCandidate(models.Model):
     candidate_id = models.ForeignKey(Candidate, on_delete=models.CASCADE)
 
 
+def normalize_ip_address(value):
+    """Returns canonical text form of IPv4/IPv6 address (IPv4-mapped IPv6 as IPv4) or None for invalid value"""
+    if value is None:
+        return None
+    try:
+        address = ipaddress.ip_address(str(value).strip())
+    except ValueError:
+        return None
+    if address.version == 6 and address.ipv4_mapped:
+        address = address.ipv4_mapped
+    return str(address)
+
+
+def _pack_ip_address(address):
+    # IPv4 is stored as IPv4-mapped IPv6 so every address takes 16 bytes and sorts within its family
+    if address.version == 4:
+        address = ipaddress.IPv6Address(b'\x00' * 10 + b'\xff' * 2 + address.packed)
+    return address.packed
+
+
+class InetAddressField(models.Field):
+    """IP address stored as PostgreSQL inet or as 16 bytes binary on other backends"""
+    description = 'IPv4 or IPv6 address'
+
+    def db_type(self, connection):
+        return {
+            'postgresql': 'inet',
+            'mysql': 'varbinary(16)',
+            'oracle': 'RAW(16)',
+        }.get(connection.vendor, 'blob')
+
+    def from_db_value(self, value, expression, connection):
+        if isinstance(value, (bytes, bytearray, memoryview)):
+            value = bytes(value)
+            if len(value) != 16:
+                return None
+            return normalize_ip_address(ipaddress.IPv6Address(value))
+        # textual values written before conversion to compact storage are normalized on read
+        return normalize_ip_address(value)
+
+    def to_python(self, value):
+        return normalize_ip_address(value)
+
+    def get_prep_value(self, value):
+        return normalize_ip_address(super(InetAddressField, self).get_prep_value(value))
+
+    def get_db_prep_value(self, value, connection, prepared=False):
+        if not prepared:
+            value = self.get_prep_value(value)
+        if value is None or connection.vendor == 'postgresql':
+            return value
+        return _pack_ip_address(ipaddress.ip_address(value))
+
+
+@InetAddressField.register_lookup
+class InSubnet(Lookup):
+    """Filters addresses within network, e.g. ip_address__in_subnet='10.0.0.0/8'"""
+    lookup_name = 'in_subnet'
+    prepare_rhs = False
+
+    def get_prep_lookup(self):
+        return ipaddress.ip_network(str(self.rhs).strip(), strict=False)
+
+    def as_sql(self, compiler, connection):
+        lhs, params = self.process_lhs(compiler, connection)
+        return '{} BETWEEN %s AND %s'.format(lhs), params + [_pack_ip_address(self.rhs.network_address),
+                                                             _pack_ip_address(self.rhs.broadcast_address)]
+
+    def as_postgresql(self, compiler, connection):
+        lhs, params = self.process_lhs(compiler, connection)
+        return '{} <<= %s::inet'.format(lhs), params + [str(self.rhs)]
+
+
 class CandidateVotes(models.Model):
     class Meta:
         db_table = 'candidate_votes'
 
     voting_candidate_ids = models.ForeignKey(VotingCandidate, on_delete=models.CASCADE)
-    ip_address = models.CharField(max_length=30)
+    # denormalized voting reference, used as partition key of candidate_votes table
+    voting_id = models.ForeignKey(Voting, on_delete=models.CASCADE, null=True)
+    # NULL for addresses which could not be parsed
+    ip_address = InetAddressField(null=True)
+
+
+# set once votes created before CandidateVotes.voting_id column are known to be backfilled
+_votes_voting_filled = False
+
+
+def get_voting_votes(voting_id):
+    """
+    Votes of voting. Denormalized voting_id is used only when no vote has it NULL, votes of previous
+    versions are found by VotingCandidate join until run_scheduler (or partition_votes) backfills them.
+    """
+    global _votes_voting_filled
+    if not _votes_voting_filled:
+        _votes_voting_filled = not CandidateVotes.objects.filter(voting_id__isnull=True).exists()
+
+    if _votes_voting_filled:
+        return CandidateVotes.objects.filter(voting_id=voting_id)
+    return CandidateVotes.objects.filter(voting_candidate_ids__voting_id=voting_id)
+
+
+class Ballot(models.Model):
+    """Approval or ranked ballot, plurality votes are stored in CandidateVotes"""
+    class Meta:
+        db_table = 'ballots'
+        indexes = [models.Index(fields=['voting_id', 'ip_address'], name='ballots_voting_ip_idx')]
+
+    voting_id = models.ForeignKey(Voting, on_delete=models.CASCADE)
+    # VotingCandidate ids in preference order packed as Voting.max_choices little-endian uint32, zero padded
+    choices = models.BinaryField()
+    ip_address = InetAddressField(null=True)
+
+    @staticmethod
+    def pack_choices(voting_candidate_ids, width):
+        ids = list(voting_candidate_ids) + [0] * (width - len(voting_candidate_ids))
+        return struct.pack('<{}I'.format(width), *ids)
+
+    @staticmethod
+    def unpack_choices(choices):
+        return [choice for choice in struct.unpack('<{}I'.format(len(choices) // 4), bytes(choices)) if choice]
+
+
+class VotingResult(models.Model):
+    class Meta:
+        db_table = 'voting_results'
+
+    voting_candidate_ids = models.OneToOneField(VotingCandidate, on_delete=models.CASCADE)
+    votes_count = models.PositiveIntegerField(default=0)
 
 
 def get_voting_queryset(status=None, **kwargs):
@@ -202,9 +355,11 @@ def try_update_voting_status(voting, status):
     ok_template = "Status for voting '{title}' [id:{id}] successfully set to {status}"
     fail_template = "Unable to set {status} status for voting '{title}' [id:{id}]: {err}"
     status_str = VotingStatus.STATUS_TO_STR_DICT[status]
+    fields = {'finalization_pending': True} if status == VotingStatus.FINISHED else {}
 
     try:
-        Voting.objects.filter(pk=voting.id).update(status=status)
+        Voting.objects.filter(pk=voting.id).update(status=status, modified=timezone.now(), **fields)
+        invalidate_votings_listing()
         return True
     except BaseException as db_err:
         # todo change to logging
@@ -212,7 +367,8 @@ def try_update_voting_status(voting, status):
         config = apps.get_app_config('voting')
         for attempt in range(getattr(config, 'activate_close_retry_count', 0)):
             try:
-                Voting.objects.filter(pk=voting.id).update(status=status)
+                Voting.objects.filter(pk=voting.id).update(status=status, modified=timezone.now(), **fields)
+                invalidate_votings_listing()
                 print(('[Attempt {attempt}]' + ok_template).
                       format(attempt=attempt + 1, id=voting.id, title=voting.title, status=status_str))
                 return True
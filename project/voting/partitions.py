@@ -0,0 +1,190 @@
+import re
+
+from django.apps import apps
+from django.db import connection, transaction
+from django.db.models import OuterRef, Subquery
+
+from .models import CandidateVotes, Voting, VotingCandidate, VotingStatus
+
+_default_partition_size = 1000
+_partition_bound_re = re.compile(r"FROM \('?(\d+)'?\) TO \('?(\d+)'?\)")
+
+
+def _partition_size():
+    size = getattr(apps.get_app_config('voting'), 'votes_partition_size', _default_partition_size)
+    if not isinstance(size, int) or size <= 0:
+        size = _default_partition_size
+    return size
+
+
+def partitioning_enabled():
+    return getattr(apps.get_app_config('voting'), 'votes_partitioning', False) and \
+        connection.vendor == 'postgresql'
+
+
+def partition_bounds(voting_id):
+    size = _partition_size()
+    lower = (int(voting_id) // size) * size
+    return lower, lower + size
+
+
+def partition_name(voting_id):
+    lower, _ = partition_bounds(voting_id)
+    return '{}_p{}'.format(CandidateVotes._meta.db_table, lower // _partition_size())
+
+
+def is_partitioned():
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_partitioned_table pt JOIN pg_class c ON c.oid = pt.partrelid "
+                       "WHERE c.relname = %s", [CandidateVotes._meta.db_table])
+        return cursor.fetchone() is not None
+
+
+def list_partitions():
+    """Return (name, lower, upper) tuples for every attached candidate_votes partition."""
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) FROM pg_inherits i "
+                       "JOIN pg_class c ON c.oid = i.inhrelid JOIN pg_class p ON p.oid = i.inhparent "
+                       "WHERE p.relname = %s ORDER BY c.relname", [CandidateVotes._meta.db_table])
+        rows = cursor.fetchall()
+
+    partitions = []
+    for name, bound in rows:
+        match = _partition_bound_re.search(bound or '')
+        if match:
+            partitions.append((name, int(match.group(1)), int(match.group(2))))
+    return partitions
+
+
+def _create_partition(cursor, voting_id):
+    lower, upper = partition_bounds(voting_id)
+    qn = connection.ops.quote_name
+    cursor.execute('CREATE TABLE IF NOT EXISTS {} PARTITION OF {} FOR VALUES FROM ({}) TO ({})'.format(
+        qn(partition_name(voting_id)), qn(CandidateVotes._meta.db_table), lower, upper))
+
+
+def ensure_votes_partition(voting_id):
+    """Create the candidate_votes partition holding votes of voting_id if it does not exist yet."""
+    if not partitioning_enabled() or not is_partitioned():
+        return False
+
+    with connection.cursor() as cursor:
+        _create_partition(cursor, voting_id)
+    return True
+
+
+def backfill_votes_voting():
+    """Fill voting reference of votes created before CandidateVotes.voting_id column was introduced."""
+    voting_id = VotingCandidate.objects.filter(id=OuterRef('voting_candidate_ids')).values('voting_id')[:1]
+    return CandidateVotes.objects.filter(voting_id__isnull=True).update(voting_id=Subquery(voting_id))
+
+
+def partition_candidate_votes():
+    """
+    Convert plain candidate_votes table into a table partitioned by range of voting id.
+    Requires PostgreSQL 11 or later. Existing votes are copied into the new partitions.
+    """
+    if connection.vendor != 'postgresql' or connection.pg_version < 110000:
+        raise RuntimeError('Declarative partitioning of votes requires PostgreSQL 11 or later')
+    if is_partitioned():
+        return 0
+
+    qn = connection.ops.quote_name
+    table = CandidateVotes._meta.db_table
+    old_table = table + '_unpartitioned'
+    voting_column = CandidateVotes._meta.get_field('voting_id').column
+    voting_candidate_column = CandidateVotes._meta.get_field('voting_candidate_ids').column
+    ip_column = CandidateVotes._meta.get_field('ip_address').column
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        backfill_votes_voting()
+
+        cursor.execute('ALTER TABLE {} RENAME TO {}'.format(qn(table), qn(old_table)))
+        cursor.execute("SELECT pg_get_serial_sequence(%s, 'id')", [old_table])
+        sequence = cursor.fetchone()[0]
+
+        cursor.execute('CREATE TABLE {} (LIKE {} INCLUDING DEFAULTS) PARTITION BY RANGE ({})'.format(
+            qn(table), qn(old_table), qn(voting_column)))
+        cursor.execute('ALTER TABLE {} ALTER COLUMN {} SET NOT NULL'.format(qn(table), qn(voting_column)))
+        cursor.execute('ALTER TABLE {} ADD CONSTRAINT {} PRIMARY KEY (id, {})'.format(
+            qn(table), qn(table + '_pk'), qn(voting_column)))
+        cursor.execute('CREATE INDEX {} ON {} ({})'.format(
+            qn(table + '_vc_idx'), qn(table), qn(voting_candidate_column)))
+        cursor.execute('CREATE INDEX {} ON {} ({}, {})'.format(
+            qn(table + '_voting_ip_idx'), qn(table), qn(voting_column), qn(ip_column)))
+        cursor.execute('ALTER TABLE {} ADD CONSTRAINT {} FOREIGN KEY ({}) REFERENCES {} (id) '
+                       'DEFERRABLE INITIALLY DEFERRED'.format(qn(table), qn(table + '_vc_fk'),
+                                                              qn(voting_candidate_column),
+                                                              qn(VotingCandidate._meta.db_table)))
+        cursor.execute('ALTER TABLE {} ADD CONSTRAINT {} FOREIGN KEY ({}) REFERENCES {} (id) '
+                       'DEFERRABLE INITIALLY DEFERRED'.format(qn(table), qn(table + '_voting_fk'),
+                                                              qn(voting_column), qn(Voting._meta.db_table)))
+
+        max_voting_id = Voting.objects.order_by('-id').values_list('id', flat=True).first() or 0
+        size = _partition_size()
+        for voting_id in range(0, max_voting_id + 1, size):
+            _create_partition(cursor, voting_id)
+
+        cursor.execute('INSERT INTO {} SELECT * FROM {}'.format(qn(table), qn(old_table)))
+        cursor.execute('SELECT count(*) FROM {}'.format(qn(table)))
+        moved_rows = cursor.fetchone()[0]
+
+        if sequence:
+            cursor.execute('ALTER SEQUENCE {} OWNED BY {}.id'.format(sequence, qn(table)))
+        cursor.execute('DROP TABLE {}'.format(qn(old_table)))
+
+    return moved_rows
+
+
+def _drop_foreign_keys(cursor, table):
+    """
+    Detached partition keeps foreign keys inherited from candidate_votes, cascade delete of votings
+    reaches only attached partitions, so these keys would block deletion of old votings.
+    """
+    qn = connection.ops.quote_name
+    cursor.execute("SELECT conname FROM pg_constraint WHERE conrelid = %s::regclass AND contype = 'f'",
+                   [qn(table)])
+    for constraint, in cursor.fetchall():
+        cursor.execute('ALTER TABLE {} DROP CONSTRAINT {}'.format(qn(table), qn(constraint)))
+
+
+def release_expired_partitions(expired_before):
+    """
+    Detach or drop partitions whose votings are all archived and finished before expired_before.
+    Returns names of released partitions.
+    """
+    if not partitioning_enabled() or not is_partitioned():
+        return []
+
+    action = getattr(apps.get_app_config('voting'), 'votes_partition_retention_action', 'detach')
+    qn = connection.ops.quote_name
+    table = CandidateVotes._meta.db_table
+    released = []
+
+    for name, lower, upper in list_partitions():
+        # range is still open for new votings
+        if not Voting.objects.filter(id__gte=upper).exists():
+            continue
+
+        votings = Voting.objects.filter(id__gte=lower, id__lt=upper)
+        if votings.filter(status__in=[VotingStatus.UNKNOWN, VotingStatus.DRAFT,
+                                      VotingStatus.WAITING_BEGINNING, VotingStatus.ACTIVE]).exists():
+            continue
+        if votings.filter(status=VotingStatus.FINISHED).exclude(votes_archived=True,
+                                                               end_date__lte=expired_before).exists():
+            continue
+
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute('ALTER TABLE {} DETACH PARTITION {}'.format(qn(table), qn(name)))
+            if action == 'drop':
+                cursor.execute('DROP TABLE {}'.format(qn(name)))
+            else:
+                # detached table is renamed so the range can be reattached later
+                cursor.execute('ALTER TABLE {} RENAME TO {}'.format(qn(name), qn(name + '_detached')))
+                _drop_foreign_keys(cursor, name + '_detached')
+
+        # todo change to logging
+        print('{} votes partition {}'.format('Dropped' if action == 'drop' else 'Detached', name))
+        released.append(name)
+
+    return released
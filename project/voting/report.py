@@ -1,3 +1,16 @@
-def crete_voting_report(voting):
+from .models import BallotType
+
+
+def crete_voting_report(voting, result=None):
     print("GENERATE REPORT FOR VOTING '{}'".format(voting.title))
+    if result is None:
+        return
+
+    print("{} ballots, {} ballot type".format(result.ballots, BallotType.TYPE_TO_STR_DICT.get(voting.ballot_type)))
+    for round_number, counts in enumerate(result.rounds, 1):
+        if len(result.rounds) > 1:
+            print("Round {}:".format(round_number))
+        for voting_candidate_id, count in zip(result.voting_candidate_ids, counts):
+            print("  voting candidate [id:{}]: {}".format(voting_candidate_id, count))
+    print("Winner: voting candidate [id:{}]".format(result.winner))
     return
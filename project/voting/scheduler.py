@@ -1,16 +1,44 @@
-from apscheduler.executors.pool import ProcessPoolExecutor
-from apscheduler.schedulers.background import BackgroundScheduler
 from django.apps import apps
 from django.utils.timezone import get_current_timezone
 
 
 class Scheduler(object):
+    """
+    Process wide APScheduler wrapper. Scheduler threads are started only in the process which owns
+    voting status transitions (`manage.py run_scheduler`), web workers never start them.
+    """
     _instance = None
+    _owner = False
     _default_thread_worker_count = 5
     _default_process_worker_count = 1
 
+    @classmethod
+    def acquire(cls):
+        """Make current process the scheduler owner and start scheduler"""
+        cls._owner = True
+        return cls()
+
+    @classmethod
+    def install(cls, aps_scheduler):
+        """Make current process the scheduler owner using supplied APScheduler compatible implementation"""
+        cls._owner = True
+        cls._instance = super(Scheduler, cls).__new__(cls)
+        cls._instance._aps_scheduler = aps_scheduler
+        return cls()
+
+    @classmethod
+    def is_running(cls):
+        return cls._instance is not None
+
     def __new__(cls, *args, **kwargs):
         if cls._instance is None:
+            if not cls._owner:
+                raise RuntimeError('Scheduler runs only in `manage.py run_scheduler` process')
+
+            # imported lazily to keep apscheduler out of web workers
+            from apscheduler.executors.pool import ProcessPoolExecutor
+            from apscheduler.schedulers.background import BackgroundScheduler
+
             cls._instance = super(Scheduler, cls).__new__(cls, *args, **kwargs)
             executors = {
                 'default': {
@@ -51,3 +79,7 @@ class Scheduler(object):
         if previous_job:
             print('Remove job: {}'.format(previous_job.name))
             previous_job.remove()
+
+    def shutdown(self):
+        self.aps.shutdown()
+        Scheduler._instance = None
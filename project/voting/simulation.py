@@ -0,0 +1,214 @@
+import heapq
+import itertools
+import random
+import time
+
+from django.apps import apps
+from django.utils import timezone
+
+from . import clock
+from .admin import activate_voting, close_voting, finalize_voting
+from .models import Voting, VotingStatus
+from .scheduler import Scheduler
+
+
+class FakeClock(object):
+    def __init__(self, start):
+        self.current = start
+
+    def now(self):
+        return self.current
+
+    def set(self, value):
+        if value > self.current:
+            self.current = value
+
+
+class SimulatedJob(object):
+    def __init__(self, scheduler, job_id, func, name, run_date, args, interval=None):
+        self._scheduler = scheduler
+        self.id = job_id
+        self.func = func
+        self.name = name
+        self.next_run_time = run_date
+        self.args = args or []
+        self.interval = interval
+
+    def remove(self):
+        self._scheduler.remove_job(self.id)
+
+
+class SimulatedScheduler(object):
+    """
+    In-memory replacement of APScheduler BackgroundScheduler driven by fake clock. Jobs are executed inline,
+    a pool of `workers` is emulated using measured job duration, jobs later than misfire_grace_time are skipped.
+    """
+
+    def __init__(self, fake_clock, workers=5, misfire_grace_time=20):
+        self.clock = fake_clock
+        self.misfire_grace_time = timezone.timedelta(seconds=misfire_grace_time)
+        self._jobs = {}
+        self._queue = []
+        self._sequence = itertools.count()
+        self._workers = [fake_clock.now()] * workers
+        self._ids = itertools.count()
+        self.executed = {}
+        self.misfired = {}
+        self.lateness = {}
+
+    def add_job(self, func, trigger, args=None, id=None, name=None, run_date=None, replace_existing=False,
+                seconds=None, **kwargs):
+        job_id = id or 'job-{}'.format(next(self._ids))
+        if job_id in self._jobs and not replace_existing:
+            raise ValueError('Job identifier ({}) conflicts with an existing job'.format(job_id))
+
+        interval = timezone.timedelta(seconds=seconds) if trigger == 'interval' else None
+        run_date = self.clock.now() + interval if interval else max(run_date, self.clock.now())
+        job = SimulatedJob(self, job_id, func, name or func.__name__, run_date, args, interval)
+        self._jobs[job_id] = job
+        heapq.heappush(self._queue, (run_date, next(self._sequence), job))
+        return job
+
+    def get_job(self, job_id):
+        return self._jobs.get(str(job_id))
+
+    def get_jobs(self):
+        return list(self._jobs.values())
+
+    def remove_job(self, job_id):
+        self._jobs.pop(str(job_id), None)
+
+    def shutdown(self, wait=True):
+        self._jobs.clear()
+        self._queue = []
+
+    def next_run_time(self):
+        while self._queue:
+            run_date, _, job = self._queue[0]
+            if self._jobs.get(job.id) is job and job.next_run_time == run_date:
+                return run_date
+            heapq.heappop(self._queue)
+        return None
+
+    def run_until(self, until):
+        """Execute all jobs due before until, advancing fake clock"""
+        while True:
+            run_date = self.next_run_time()
+            if run_date is None or run_date > until:
+                break
+
+            _, _, job = heapq.heappop(self._queue)
+            kind = job.func.__name__
+            if job.interval:
+                job.next_run_time = run_date + job.interval
+                heapq.heappush(self._queue, (job.next_run_time, next(self._sequence), job))
+            else:
+                del self._jobs[job.id]
+
+            worker_free = heapq.heappop(self._workers)
+            started = max(run_date, worker_free)
+            if started - run_date > self.misfire_grace_time:
+                heapq.heappush(self._workers, worker_free)
+                self.misfired[kind] = self.misfired.get(kind, 0) + 1
+                continue
+
+            self.clock.set(started)
+            wall_started = time.time()
+            job.func(*job.args)
+            duration = timezone.timedelta(seconds=time.time() - wall_started)
+            heapq.heappush(self._workers, started + duration)
+
+            self.executed[kind] = self.executed.get(kind, 0) + 1
+            self.lateness.setdefault(kind, []).append((started - run_date).total_seconds())
+
+        self.clock.set(until)
+
+
+def publish_voting(voting):
+    """DRAFT -> WAITING transition as done by admin save"""
+    voting.status = VotingStatus.WAITING_BEGINNING
+    voting.save()
+
+
+def stale_votings(now, tolerance):
+    """Votings which must have changed status more than tolerance ago"""
+    return Voting.objects.filter(status=VotingStatus.WAITING_BEGINNING, start_date__lt=now - tolerance).count() + \
+        Voting.objects.filter(status=VotingStatus.ACTIVE, end_date__lt=now - tolerance).count()
+
+
+def _percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))] if values else 0.0
+
+
+def simulate_lifecycle(votings=100000, days=7, round_minutes=60, workers=5, misfire_grace_time=20, seed=0,
+                       finalize=True, check_interval=timezone.timedelta(hours=1)):
+    """
+    Replay DRAFT -> WAITING -> ACTIVE -> FINISHED lifecycle of generated votings with fake clock.
+    Must be run against a test database. Returns statistics dict.
+    """
+    config = apps.get_app_config('voting')
+    finalize_configs = dict((name, getattr(config, name, False))
+                            for name in ('generate_report_on_close', 'archive_votes_on_close'))
+    rnd = random.Random(seed)
+    start = timezone.now().replace(minute=0, second=0, microsecond=0)
+    fake_clock = FakeClock(start)
+    scheduler = SimulatedScheduler(fake_clock, workers, misfire_grace_time)
+
+    objects = []
+    for index in range(votings):
+        start_date = start + timezone.timedelta(minutes=rnd.randint(60, days * 24 * 60))
+        start_date -= timezone.timedelta(minutes=start_date.minute % round_minutes)
+        end_date = start_date + timezone.timedelta(minutes=rnd.choice([1, 30, 60, 24 * 60]))
+        objects.append(Voting(title='Simulated voting {}'.format(index), description='simulation',
+                              start_date=start_date, end_date=end_date, status=VotingStatus.DRAFT))
+    Voting.objects.bulk_create(objects)
+
+    if not finalize:
+        for name in finalize_configs:
+            setattr(config, name, False)
+    clock.install(fake_clock.now)
+    Scheduler.install(scheduler)
+    wall_started = time.time()
+    stale_checks = []
+    try:
+        # votings are published by admins between creation and start
+        for voting in Voting.objects.all().iterator():
+            publish_date = start + (voting.start_date - start) * rnd.random()
+            scheduler.add_job(publish_voting, 'date', id='publish-{}'.format(voting.id), run_date=publish_date,
+                              args=[voting])
+
+        tolerance = scheduler.misfire_grace_time
+        finish = start + timezone.timedelta(days=days + 2)
+        checkpoint = start
+        while checkpoint < finish:
+            checkpoint += check_interval
+            scheduler.run_until(checkpoint)
+            stale_checks.append((checkpoint, stale_votings(checkpoint, tolerance)))
+    finally:
+        scheduler.shutdown()
+        Scheduler._instance = None
+        clock.install()
+        for name, value in finalize_configs.items():
+            setattr(config, name, value)
+
+    wall_time = time.time() - wall_started
+    transitions = sum(scheduler.executed.get(f.__name__, 0) for f in (activate_voting, close_voting))
+    lateness = dict((kind, {
+        'mean': sum(values) / len(values),
+        'p99': _percentile(values, 0.99),
+        'max': max(values),
+    }) for kind, values in scheduler.lateness.items() if values)
+
+    return {
+        'votings': votings,
+        'wall_time': wall_time,
+        'transitions': transitions,
+        'throughput': transitions / wall_time if wall_time else 0.0,
+        'executed': scheduler.executed,
+        'misfired': scheduler.misfired,
+        'lateness': lateness,
+        'stale_checks': [(checkpoint, count) for checkpoint, count in stale_checks if count],
+        'not_finished': Voting.objects.exclude(status=VotingStatus.FINISHED).count(),
+        'finalized': scheduler.executed.get(finalize_voting.__name__, 0),
+    }
@@ -32,18 +32,21 @@ class VotingTable(tables.Table):
 
 
 class ImageColumn(tables.Column):
+    template_str = """
+        {% load static %}
+        {% if not photo %}
+            <img src="{% static "without_photo.jpg"%}"/>
+        {% else %}
+            <img src="{{ photo.url }}" />
+        {% endif %}
+    """
+    _template = None
+
     def render(self, value):
-        template_str = """
-            {% load static %}
-            {% if not photo %}
-                <img src="{% static "without_photo.jpg"%}"/>
-            {% else %}
-                <img src="{{ photo.url }}" />
-            {% endif %}
-        """
-        # template = Template('<img src="{{ photo.url }}" />')
-        template = Template(template_str)
-        return mark_safe(template.render(Context({'photo': value})))
+        # template is compiled once per process instead of once per cell
+        if ImageColumn._template is None:
+            ImageColumn._template = Template(self.template_str)
+        return mark_safe(ImageColumn._template.render(Context({'photo': value})))
 
 
 class VotingCandidatesTable(tables.Table):
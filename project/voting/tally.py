@@ -0,0 +1,138 @@
+import numpy as np
+from django.apps import apps
+
+from .models import Ballot, BallotType, CandidateVotes, VotingCandidate
+
+
+class TallyResult(object):
+    """
+    Result of voting tally. `counts` holds final votes per VotingCandidate id, `rounds` holds
+    per round counts of instant-runoff (single round for other ballot types).
+    """
+
+    def __init__(self, voting_candidate_ids, rounds, ballots, winner=None):
+        self.voting_candidate_ids = [int(vc_id) for vc_id in voting_candidate_ids]
+        self.rounds = [[int(count) for count in counts] for counts in rounds]
+        self.ballots = int(ballots)
+        self.winner = winner
+
+    @property
+    def counts(self):
+        # eliminated candidates keep their count from the round they were eliminated in
+        final = {}
+        for counts in self.rounds:
+            for vc_id, count in zip(self.voting_candidate_ids, counts):
+                if count or vc_id not in final:
+                    final[vc_id] = count
+        return final
+
+
+def _chunk_size():
+    return getattr(apps.get_app_config('voting'), 'tally_chunk_size', 100000)
+
+
+def decode_ballots(blobs, voting_candidate_ids, width):
+    """
+    Build (ballots, width + 1) matrix of candidate indexes from packed ballots, empty choices and unknown
+    candidates get index len(voting_candidate_ids) which marks exhausted ballot.
+    """
+    sorted_ids = np.asarray(sorted(voting_candidate_ids), dtype=np.uint32)
+    exhausted = len(sorted_ids)
+    raw = np.frombuffer(b''.join(blobs), dtype='<u4').reshape(-1, width)
+    return encode_choices(raw, sorted_ids, exhausted)
+
+
+def encode_choices(raw, sorted_ids, exhausted):
+    index = np.searchsorted(sorted_ids, raw)
+    index_clipped = np.minimum(index, max(exhausted - 1, 0))
+    known = (sorted_ids[index_clipped] == raw) if exhausted else np.zeros(raw.shape, dtype=bool)
+    matrix = np.where(known, index_clipped, exhausted).astype(np.int32)
+    # sentinel column keeps preference pointers inside the matrix
+    return np.hstack([matrix, np.full((matrix.shape[0], 1), exhausted, dtype=np.int32)])
+
+
+def load_ballots(voting):
+    """Returns (sorted VotingCandidate ids, choices matrix) of voting"""
+    voting_candidate_ids = sorted(VotingCandidate.objects.filter(voting_id=voting.id).values_list('id', flat=True))
+
+    if voting.ballot_type == BallotType.PLURALITY:
+        votes = CandidateVotes.objects.filter(voting_candidate_ids__voting_id=voting.id)\
+            .values_list('voting_candidate_ids', flat=True).iterator(chunk_size=_chunk_size())
+        raw = np.fromiter(votes, dtype=np.uint32).reshape(-1, 1)
+        return voting_candidate_ids, encode_choices(raw, np.asarray(voting_candidate_ids, dtype=np.uint32),
+                                                    len(voting_candidate_ids))
+
+    width = max(voting.max_choices, 1)
+    chunk_size = _chunk_size()
+    chunks, blobs = [], []
+    for blob in Ballot.objects.filter(voting_id=voting.id).values_list('choices', flat=True)\
+            .iterator(chunk_size=chunk_size):
+        blobs.append(bytes(blob))
+        if len(blobs) >= chunk_size:
+            chunks.append(decode_ballots(blobs, voting_candidate_ids, width))
+            blobs = []
+    chunks.append(decode_ballots(blobs, voting_candidate_ids, width))
+    return voting_candidate_ids, np.vstack(chunks)
+
+
+def plurality(matrix, candidates):
+    return np.bincount(matrix[:, 0], minlength=candidates + 1)[:candidates]
+
+
+def approval(matrix, candidates):
+    return np.bincount(matrix[:, :-1].ravel(), minlength=candidates + 1)[:candidates]
+
+
+def instant_runoff(matrix, candidates):
+    """
+    Instant-runoff rounds: every ballot points to its highest ranked candidate still in the race, after each
+    round the weakest candidate is eliminated and only ballots pointing to it are advanced.
+    Returns (per round counts, winner index or None).
+    """
+    rows = np.arange(matrix.shape[0])
+    pointer = np.zeros(matrix.shape[0], dtype=np.int32)
+    # last element is "exhausted" pseudo candidate which is never eliminated
+    eliminated = np.zeros(candidates + 1, dtype=bool)
+    first_preferences = None
+    rounds = []
+
+    while True:
+        current = matrix[rows, pointer]
+        counts = np.bincount(current, minlength=candidates + 1)[:candidates]
+        rounds.append(counts)
+        if first_preferences is None:
+            first_preferences = counts
+
+        remaining = np.flatnonzero(~eliminated[:candidates])
+        active_ballots = counts.sum()
+        if not len(remaining) or not active_ballots:
+            return rounds, None
+        leader = remaining[np.argmax(counts[remaining])]
+        if len(remaining) == 1 or counts[leader] * 2 > active_ballots:
+            return rounds, int(leader)
+
+        # weakest remaining candidate, ties broken by first preferences then by lower position
+        order = np.lexsort((-remaining, first_preferences[remaining], counts[remaining]))
+        eliminated[remaining[order[0]]] = True
+
+        moving = np.flatnonzero(eliminated[current])
+        while len(moving):
+            pointer[moving] += 1
+            moving = moving[eliminated[matrix[moving, pointer[moving]]]]
+
+
+def tally(ballot_type, matrix, candidates):
+    if ballot_type == BallotType.RANKED:
+        return instant_runoff(matrix, candidates)
+
+    counts = approval(matrix, candidates) if ballot_type == BallotType.APPROVAL else plurality(matrix, candidates)
+    winner = int(np.argmax(counts)) if candidates and counts.any() else None
+    return [counts], winner
+
+
+def tally_voting(voting):
+    """Load ballots of voting and compute its result"""
+    voting_candidate_ids, matrix = load_ballots(voting)
+    rounds, winner = tally(voting.ballot_type, matrix, len(voting_candidate_ids))
+    return TallyResult(voting_candidate_ids, rounds, matrix.shape[0],
+                       voting_candidate_ids[winner] if winner is not None else None)
@@ -0,0 +1,236 @@
+import random
+
+import numpy as np
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, TestCase
+from django.utils import timezone
+
+from .admin import VotingForm, _expire_overdue_votings, finalize_voting, sync_voting_jobs
+from .bulk import import_votings
+from .models import Ballot, BallotType, Candidate, Voting, VotingCandidate, VotingStatus, try_update_voting_status
+from .scheduler import Scheduler
+from .tally import TallyResult, decode_ballots, instant_runoff, tally
+
+# VotingCandidate ids of test votings, deliberately not contiguous
+IDS = [3, 7, 11, 20]
+
+
+def _matrix(ballots, width=3, ids=IDS):
+    """Ballots are lists of VotingCandidate ids in preference order"""
+    return decode_ballots([Ballot.pack_choices(ballot, width) for ballot in ballots], ids, width)
+
+
+def _reference_irv(ballots, candidates):
+    """Straightforward instant-runoff over lists of candidate indexes with the same tie-break rules"""
+    eliminated, rounds = set(), []
+    while True:
+        counts = [0] * candidates
+        for ballot in ballots:
+            for choice in ballot:
+                if choice not in eliminated:
+                    counts[choice] += 1
+                    break
+        rounds.append(counts)
+
+        remaining = [index for index in range(candidates) if index not in eliminated]
+        if not remaining or not sum(counts):
+            return rounds, None
+        leader = max(remaining, key=lambda index: (counts[index], -index))
+        if len(remaining) == 1 or counts[leader] * 2 > sum(counts):
+            return rounds, leader
+        eliminated.add(min(remaining, key=lambda index: (counts[index], rounds[0][index], -index)))
+
+
+class BallotPackingTest(SimpleTestCase):
+    def test_pack_unpack(self):
+        choices = Ballot.pack_choices([20, 3], 3)
+        self.assertEqual(len(choices), 12)
+        self.assertEqual(Ballot.unpack_choices(choices), [20, 3])
+
+    def test_decode_maps_unknown_and_empty_choices_to_sentinel(self):
+        matrix = _matrix([[7, 99, 3], []])
+        exhausted = len(IDS)
+        self.assertEqual(matrix.shape, (2, 4))
+        self.assertEqual(matrix.tolist(), [[1, exhausted, 0, exhausted], [exhausted] * 4])
+
+    def test_decode_without_ballots_and_candidates(self):
+        self.assertEqual(decode_ballots([], IDS, 3).shape, (0, 4))
+        self.assertEqual(decode_ballots([], [], 3).shape, (0, 4))
+
+
+class PluralityTallyTest(SimpleTestCase):
+    def test_counts_first_choice_only(self):
+        rounds, winner = tally(BallotType.PLURALITY, _matrix([[7], [7], [3], [99]], width=1), len(IDS))
+        self.assertEqual(rounds[0].tolist(), [1, 2, 0, 0])
+        self.assertEqual(winner, 1)
+
+    def test_no_winner_without_votes(self):
+        rounds, winner = tally(BallotType.PLURALITY, _matrix([], width=1), len(IDS))
+        self.assertEqual(rounds[0].tolist(), [0, 0, 0, 0])
+        self.assertIsNone(winner)
+
+
+class ApprovalTallyTest(SimpleTestCase):
+    def test_counts_every_approved_candidate(self):
+        rounds, winner = tally(BallotType.APPROVAL, _matrix([[3, 7], [7], [7, 11, 20], [99, 20]]), len(IDS))
+        self.assertEqual(rounds[0].tolist(), [1, 3, 1, 2])
+        self.assertEqual(winner, 1)
+
+    def test_tie_is_won_by_first_candidate(self):
+        rounds, winner = tally(BallotType.APPROVAL, _matrix([[11, 20], [20, 11]]), len(IDS))
+        self.assertEqual(winner, 2)
+
+
+class InstantRunoffTest(SimpleTestCase):
+    def test_first_round_majority(self):
+        rounds, winner = instant_runoff(_matrix([[3], [3, 7], [7]]), len(IDS))
+        self.assertEqual(len(rounds), 1)
+        self.assertEqual(winner, 0)
+
+    def test_votes_of_eliminated_candidates_are_transferred(self):
+        # candidate without votes (20) is eliminated first, then 11 transfers its ballot to 7
+        ballots = [[3], [3], [7], [7], [11, 7]]
+        rounds, winner = instant_runoff(_matrix(ballots), len(IDS))
+        self.assertEqual([counts.tolist() for counts in rounds], [[2, 2, 1, 0], [2, 2, 1, 0], [2, 3, 0, 0]])
+        self.assertEqual(winner, 1)
+
+    def test_exhausted_ballots_do_not_count_for_majority(self):
+        # after 11 is eliminated its ballot is exhausted, 3 wins 2 of 3 remaining ballots
+        ballots = [[3], [3], [7], [11]]
+        rounds, winner = instant_runoff(_matrix(ballots), len(IDS))
+        self.assertEqual(rounds[-1].tolist(), [2, 1, 0, 0])
+        self.assertEqual(winner, 0)
+
+    def test_chained_elimination_skips_already_eliminated_choices(self):
+        # 11 is eliminated before 20, ballots of 20 skip 11 and go to 7
+        ballots = [[3]] * 3 + [[7]] * 3 + [[11], [20, 11, 7], [20, 11, 7]]
+        rounds, winner = instant_runoff(_matrix(ballots), len(IDS))
+        self.assertEqual([counts.tolist() for counts in rounds], [[3, 3, 1, 2], [3, 3, 0, 2], [3, 5, 0, 0]])
+        self.assertEqual(winner, 1)
+
+    def test_elimination_tie_is_broken_by_later_candidate(self):
+        # 11 and 20 are tied on every level, 20 is eliminated first and its vote goes to 3
+        ballots = [[3], [7], [11, 7], [20, 3]]
+        rounds, winner = instant_runoff(_matrix(ballots), len(IDS))
+        self.assertEqual(rounds[1].tolist(), [2, 1, 1, 0])
+
+    def test_no_winner_without_ballots(self):
+        rounds, winner = instant_runoff(_matrix([]), len(IDS))
+        self.assertIsNone(winner)
+
+    def test_matches_reference_on_random_elections(self):
+        generator = random.Random(2019)
+        for _ in range(2000):
+            candidates = generator.randint(1, 6)
+            width = generator.randint(1, candidates)
+            ids = sorted(generator.sample(range(1, 100), candidates))
+            ballots = [generator.sample(range(candidates), generator.randint(0, width))
+                       for _ in range(generator.randint(0, 30))]
+
+            matrix = _matrix([[ids[index] for index in ballot] for ballot in ballots], width, ids)
+            rounds, winner = instant_runoff(matrix, candidates)
+            expected_rounds, expected_winner = _reference_irv(ballots, candidates)
+            self.assertEqual([counts.tolist() for counts in rounds], expected_rounds, ballots)
+            self.assertEqual(winner, expected_winner, ballots)
+
+
+class TallyResultTest(SimpleTestCase):
+    def test_eliminated_candidates_keep_last_count(self):
+        rounds = [np.array([2, 2, 1, 0]), np.array([2, 3, 0, 0])]
+        result = TallyResult(IDS, rounds, 5, winner=7)
+        self.assertEqual(result.counts, {3: 2, 7: 3, 11: 1, 20: 0})
+        self.assertEqual(result.rounds, [[2, 2, 1, 0], [2, 3, 0, 0]])
+
+
+class ExpireOverdueVotingsTest(TestCase):
+    def _overdue_voting(self, ballot_type):
+        now = timezone.now()
+        voting = Voting.objects.create(title='Overdue voting', description='Description', status=VotingStatus.ACTIVE,
+                                       ballot_type=ballot_type, max_choices=2,
+                                       start_date=now - timezone.timedelta(days=2),
+                                       end_date=now - timezone.timedelta(days=1))
+        candidate = Candidate.objects.create(last_name='Last', first_name='First', middle_name='Middle', age=40,
+                                             biography='Biography')
+        return voting, VotingCandidate.objects.create(voting_id=voting, candidate_id=candidate)
+
+    def test_voting_with_ballots_is_finished(self):
+        voting, voting_candidate = self._overdue_voting(BallotType.RANKED)
+        Ballot.objects.create(voting_id=voting, choices=Ballot.pack_choices([voting_candidate.id], 2))
+        empty_voting, _ = self._overdue_voting(BallotType.RANKED)
+
+        _expire_overdue_votings()
+        voting.refresh_from_db()
+        empty_voting.refresh_from_db()
+        self.assertEqual(voting.status, VotingStatus.FINISHED)
+        self.assertEqual(empty_voting.status, VotingStatus.FINISHED_WITHOUT_VOTERS)
+
+
+class ImportVotingsTest(TestCase):
+    def test_rows_with_missing_or_invalid_dates_are_rejected(self):
+        start = timezone.localtime() + timezone.timedelta(days=1)
+        row = {'title': 'Imported voting', 'description': 'Description',
+               'start_date': start.strftime('%Y-%m-%d %H:%M:%S'),
+               'end_date': (start + timezone.timedelta(days=1)).strftime('%Y-%m-%d %H:%M:%S')}
+        without_start = dict(row)
+        del without_start['start_date']
+
+        created, errors = import_votings([(2, without_start), (3, dict(row, end_date='tomorrow')), (4, row)])
+        self.assertEqual([voting.title for voting in created], ['Imported voting'])
+        self.assertEqual([line_num for line_num, _ in errors], [2, 3])
+        self.assertIn('start_date', errors[0][1])
+        self.assertIn('end_date', errors[1][1])
+
+
+class VotingAdminTest(TestCase):
+    def test_unknown_status_filter_value(self):
+        User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.login(username='admin', password='password')
+        for status in ('abc', str(VotingStatus.ACTIVE)):
+            self.assertEqual(self.client.get('/admin/voting/voting/', {'status': status}).status_code, 200)
+
+
+class VotingFormTest(TestCase):
+    def test_ballot_settings_of_finished_voting_cannot_be_changed(self):
+        now = timezone.now()
+        voting = Voting.objects.create(title='Finished voting', description='Description',
+                                       status=VotingStatus.FINISHED, ballot_type=BallotType.RANKED, max_choices=3,
+                                       start_date=now - timezone.timedelta(days=2),
+                                       end_date=now - timezone.timedelta(days=1))
+        data = {'title': voting.title, 'description': voting.description,
+                'start_date': timezone.localtime(voting.start_date).strftime('%Y-%m-%d %H:%M:%S'),
+                'end_date': timezone.localtime(voting.end_date).strftime('%Y-%m-%d %H:%M:%S'),
+                'max_votes': 0, 'ballot_type': BallotType.APPROVAL, 'max_choices': 5}
+        form = VotingForm(data=data, instance=voting)
+        form.is_valid()
+        self.assertEqual(form.cleaned_data['ballot_type'], BallotType.RANKED)
+        self.assertEqual(form.cleaned_data['max_choices'], 3)
+
+
+class PendingFinalizationTest(TestCase):
+    def setUp(self):
+        from apscheduler.schedulers.background import BackgroundScheduler
+        # scheduler is not started, jobs are only registered
+        Scheduler.install(BackgroundScheduler())
+
+    def tearDown(self):
+        Scheduler._instance = None
+        Scheduler._owner = False
+
+    def test_full_sync_finalizes_voting_closed_by_web_worker(self):
+        now = timezone.now()
+        voting = Voting.objects.create(title='Closed voting', description='Description', status=VotingStatus.ACTIVE,
+                                       ballot_type=BallotType.APPROVAL, max_choices=2,
+                                       start_date=now - timezone.timedelta(days=1),
+                                       end_date=now + timezone.timedelta(days=1))
+        # premature close in web worker leaves no job in (restarted) scheduler
+        try_update_voting_status(voting, VotingStatus.FINISHED)
+        voting.refresh_from_db()
+        self.assertTrue(voting.finalization_pending)
+
+        sync_voting_jobs()
+        job = Scheduler().aps.get_job(str(voting.id))
+        self.assertIs(job.func, finalize_voting)
+
+        finalize_voting(voting)
+        voting.refresh_from_db()
+        self.assertFalse(voting.finalization_pending)
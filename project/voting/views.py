@@ -1,12 +1,16 @@
 from django.apps import apps
 from django.db import transaction
-from django.db.models import Count
+from django.db.models import Count, F, Value
+from django.db.models.functions import Coalesce
+from django.http import HttpResponse, JsonResponse, HttpResponseForbidden
 from django.shortcuts import get_object_or_404
 from django.views.generic import ListView
 from django_tables2 import RequestConfig
 
 from .admin import close_voting
-from .models import Voting, VotingStatus, VotingCandidate, CandidateVotes
+from .caching import get_cached_listing, listing_key, set_cached_listing
+from .models import Ballot, BallotType, Voting, VotingStatus, VotingCandidate, CandidateVotes, get_voting_votes, \
+    normalize_ip_address
 from .tables import VotingTable, VotingCandidatesTable
 
 
@@ -15,6 +19,29 @@ class VotingsView(ListView):
     template_name = 'votings.html'
     ordering = ['start_date']
 
+    def get(self, request, *args, **kwargs):
+        status = self.kwargs['status'] or 'active'
+        page = request.GET.get('page', '1')
+        sort = request.GET.get('sort', '')
+
+        # pages with unexpected arguments are rendered without caching
+        if not page.isdigit() or sort.lstrip('-') not in ('',) + VotingTable.Meta.fields:
+            return super(VotingsView, self).get(request, *args, **kwargs)
+
+        key = listing_key(status, page, sort)
+        if key is None:
+            return super(VotingsView, self).get(request, *args, **kwargs)
+
+        content = get_cached_listing(key)
+        if content is not None:
+            return HttpResponse(content)
+
+        response = super(VotingsView, self).get(request, *args, **kwargs)
+        response.render()
+        if response.status_code == 200:
+            set_cached_listing(key, response.content)
+        return response
+
     def get_context_data(self, **kwargs):
         context = super(VotingsView, self).get_context_data(**kwargs)
         table = VotingTable(self.get_queryset())
@@ -42,9 +69,16 @@ class VotingDetailsView(ListView):
 
     def get_context_data(self, **kwargs):
         context = super(VotingDetailsView, self).get_context_data(**kwargs)
-        table = VotingCandidatesTable(self.table_date)
+        # FINISHED votings are rendered without Vote column, approval and ranked votings use ballot form
+        exclude = ('vote',) if self.voting.status == VotingStatus.FINISHED or \
+            self.voting.ballot_type != BallotType.PLURALITY else ()
+        table = VotingCandidatesTable(self.table_date, exclude=exclude)
         context['table'] = table
         context['voting'] = self.voting
+        if self.voting.status == VotingStatus.ACTIVE and self.voting.ballot_type != BallotType.PLURALITY:
+            context['ballot_candidates'] = self.table_date
+            if self.voting.ballot_type == BallotType.RANKED:
+                context['ballot_ranks'] = range(1, self.voting.max_choices + 1)
         return context
 
     def get_queryset(self):
@@ -60,7 +94,17 @@ class VotingDetailsView(ListView):
         # candidate_with_votes sorted by descending votes number
         self.table_date = []
         qs = VotingCandidate.objects.filter(candidate_id__in=candidate_ids, voting_id=voting_id)
-        for candidate in qs.annotate(votes_num=Count('candidatevotes__ip_address')).order_by('-votes_num'):
+        if self.voting.votes_archived:
+            # raw votes of archived voting may be already purged, use compacted results
+            candidates = qs.annotate(votes_num=Coalesce('votingresult__votes_count', Value(0))).order_by('-votes_num')
+        elif self.voting.ballot_type == BallotType.PLURALITY:
+            candidates = qs.annotate(votes_num=Count('candidatevotes')).order_by('-votes_num')
+        else:
+            # approval and ranked results are tallied once by finalization, hidden until it is done
+            candidates = qs.annotate(votes_num=F('votingresult__votes_count'))\
+                .order_by(F('votes_num').desc(nulls_last=True))
+
+        for candidate in candidates:
             self.table_date.append({
                 'photo': candidate.candidate_id.photo_thumbnail,
                 'last_name': candidate.candidate_id.last_name,
@@ -74,6 +118,61 @@ class VotingDetailsView(ListView):
             })
 
 
+_unknown_address_message = 'Sorry, your address cannot be verified:('
+
+
+def get_client_ip(meta):
+    x_forwarded_for = meta.get('HTTP_X_FORWARDED_FOR')
+    ip = normalize_ip_address(x_forwarded_for.split(',')[0]) if x_forwarded_for else None
+    return ip or normalize_ip_address(meta.get('REMOTE_ADDR'))
+
+
+def send_vote(voting_id, candidate_id, ip):
+    """Register vote of client with supplied ip address, returns message for the client"""
+    # prefetch voting object for subsequent status checking
+    candidate = get_object_or_404(VotingCandidate.objects.filter(
+        voting_id=voting_id, candidate_id=candidate_id).select_related('voting_id'))
+
+    message = "Sorry, voting '{}' is over:(".format(candidate.voting_id.title)
+    successful_vote_message = 'Thank you for your vote!'
+    if candidate.voting_id.status != VotingStatus.ACTIVE:
+        return message
+    if candidate.voting_id.ballot_type != BallotType.PLURALITY:
+        return 'This voting accepts only ballots'
+
+    # check attempt to vote second time by client IP, client without valid address cannot be checked
+    if getattr(apps.get_app_config('voting'), 'check_ip_address', True):
+        if ip is None:
+            return _unknown_address_message
+        if get_voting_votes(voting_id).filter(ip_address=ip).exists():
+            return 'You already participated in the vote:('
+
+    if candidate.voting_id.max_votes > 0:
+        with transaction.atomic():
+            voting_candidate = VotingCandidate.objects.filter(
+                candidate_id=candidate_id,
+                voting_id=voting_id).select_for_update().get()
+
+            candidate_votes = get_voting_votes(voting_id).filter(
+                voting_candidate_ids__candidate_id=candidate_id).annotate(votes_num=Count('id'))
+
+            voting = voting_candidate.voting_id
+            voting.refresh_from_db()
+            if voting.status != VotingStatus.ACTIVE or \
+                    (voting.max_votes and len(candidate_votes) and
+                     candidate_votes[0].votes_num >= voting.max_votes):
+                close_voting(voting_candidate.voting_id)
+                return message
+
+            CandidateVotes(voting_candidate_ids=voting_candidate, voting_id=voting, ip_address=ip).save()
+            if voting.max_votes and len(candidate_votes) and candidate_votes[0].votes_num + 1 >= voting.max_votes:
+                close_voting(voting_candidate.voting_id)
+    else:
+        CandidateVotes(voting_candidate_ids=candidate, voting_id=candidate.voting_id, ip_address=ip).save()
+
+    return successful_vote_message
+
+
 class SendVoteView(ListView):
     model = Voting
     template_name = 'vote_result.html'
@@ -84,51 +183,87 @@ class SendVoteView(ListView):
         return context
 
     def get_queryset(self):
-        voting_id = self.kwargs['voting_id']
-        candidate_id = self.kwargs['candidate_id']
-        # prefetch voting object for subsequent status checking
-        candidate = get_object_or_404(VotingCandidate.objects.filter(
-            voting_id=voting_id, candidate_id=candidate_id).select_related('voting_id'))
-
-        self.message = "Sorry, voting '{}' is over:(".format(candidate.voting_id.title)
-        successful_vote_message = 'Thank you for your vote!'
-        if candidate.voting_id.status != VotingStatus.ACTIVE:
-            return
+        self.message = send_vote(self.kwargs['voting_id'], self.kwargs['candidate_id'],
+                                 get_client_ip(self.request.META))
 
-        x_forwarded_for = self.request.META.get('HTTP_X_FORWARDED_FOR')
-        if x_forwarded_for:
-            ip = x_forwarded_for.split(',')[0]
-        else:
-            ip = self.request.META.get('REMOTE_ADDR')
 
-        # check attempt to vote second time by client IP
-        if getattr(apps.get_app_config('voting'), 'check_ip_address', True) and \
-                VotingCandidate.objects.filter(voting_id=voting_id, candidatevotes__ip_address__contains=ip).all():
-            self.message = 'You already participated in the vote:('
+def parse_ballot_choices(values):
+    """Candidate ids from repeated and/or comma separated `candidates` arguments, None for malformed value"""
+    choices = [choice.strip() for value in values for choice in value.split(',') if choice.strip()]
+    if not all(choice.isdigit() for choice in choices):
+        return None
+    return [int(choice) for choice in choices]
+
+
+def send_ballot(voting_id, candidate_ids, ip):
+    """Register approval or ranked ballot (candidate ids in preference order), returns message for the client"""
+    voting = get_object_or_404(Voting, id=voting_id)
+
+    message = "Sorry, voting '{}' is over:(".format(voting.title)
+    if voting.status != VotingStatus.ACTIVE:
+        return message
+    if voting.ballot_type == BallotType.PLURALITY:
+        return 'This voting accepts only single vote'
+
+    if not candidate_ids:
+        return 'Ballot is empty:('
+    if len(candidate_ids) > voting.max_choices:
+        return 'Ballot may contain at most {} candidates'.format(voting.max_choices)
+    if len(set(candidate_ids)) != len(candidate_ids):
+        return 'Ballot contains the same candidate twice'
+
+    voting_candidates = dict(VotingCandidate.objects.filter(
+        voting_id=voting_id, candidate_id__in=candidate_ids).values_list('candidate_id', 'id'))
+    if len(voting_candidates) != len(candidate_ids):
+        return 'Ballot contains unknown candidate'
+
+    # check attempt to vote second time by client IP, client without valid address cannot be checked
+    if getattr(apps.get_app_config('voting'), 'check_ip_address', True):
+        if ip is None:
+            return _unknown_address_message
+        if Ballot.objects.filter(voting_id=voting_id, ip_address=ip).exists():
+            return 'You already participated in the vote:('
+
+    ballot = Ballot(voting_id=voting, ip_address=ip, choices=Ballot.pack_choices(
+        [voting_candidates[candidate_id] for candidate_id in candidate_ids], voting.max_choices))
+
+    if voting.max_votes > 0:
+        with transaction.atomic():
+            voting = Voting.objects.select_for_update().get(id=voting_id)
+            ballots_count = Ballot.objects.filter(voting_id=voting_id).count()
+            if voting.status != VotingStatus.ACTIVE or ballots_count >= voting.max_votes:
+                close_voting(voting)
+                return message
+
+            ballot.save()
+            if ballots_count + 1 >= voting.max_votes:
+                close_voting(voting)
+    else:
+        ballot.save()
+
+    return 'Thank you for your vote!'
+
+
+class SendBallotView(ListView):
+    model = Voting
+    template_name = 'vote_result.html'
+
+    def get_context_data(self, **kwargs):
+        context = super(SendBallotView, self).get_context_data(**kwargs)
+        context['message'] = self.message
+        return context
+
+    def get_queryset(self):
+        candidate_ids = parse_ballot_choices(self.request.GET.getlist('candidates'))
+        if candidate_ids is None:
+            self.message = 'Ballot contains unknown candidate'
             return
+        self.message = send_ballot(self.kwargs['voting_id'], candidate_ids, get_client_ip(self.request.META))
 
-        if candidate.voting_id.max_votes > 0:
-            with transaction.atomic():
-                voting_candidate = VotingCandidate.objects.filter(
-                    candidate_id=candidate_id,
-                    voting_id=voting_id).select_for_update().get()
-
-                candidate_votes = CandidateVotes.objects.filter(
-                    voting_candidate_ids__voting_id=voting_id,
-                    voting_candidate_ids__candidate_id=candidate_id).annotate(votes_num=Count('ip_address'))
-
-                voting = voting_candidate.voting_id
-                voting.refresh_from_db()
-                if voting.status != VotingStatus.ACTIVE or \
-                        (voting.max_votes and len(candidate_votes) and
-                         candidate_votes[0].votes_num >= voting.max_votes):
-                    close_voting(voting_candidate.voting_id)
-                    return
-
-                self.message = successful_vote_message
-                CandidateVotes(voting_candidate_ids=voting_candidate, ip_address=ip).save()
-                if voting.max_votes and len(candidate_votes) and candidate_votes[0].votes_num + 1 >= voting.max_votes:
-                    close_voting(voting_candidate.voting_id)
-        else:
-            self.message = successful_vote_message
-            CandidateVotes(voting_candidate_ids=candidate, ip_address=ip).save()
+
+def rate_limit_metrics(request):
+    from .middleware import get_rate_limiter
+
+    if not request.user.is_staff:
+        return HttpResponseForbidden()
+    return JsonResponse(get_rate_limiter().metrics())